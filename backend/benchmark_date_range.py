@@ -0,0 +1,60 @@
+"""
+Benchmark: date range filters as binary-searched blocks of the date-ordered
+facts vs the union of the `data` postings.
+
+Usage: python benchmark_date_range.py [rows ...]
+
+Builds synthetic fact tables of each size (default 1M and 5M facts per table)
+spread over ten years, checks that both paths select the same rows and prints
+the time to filter one quarter, with and without a supplier, and of a custom
+quarter /metrics request served from the facts.
+"""
+import sys
+import time
+
+import numpy as np
+
+sys.path.append('.')
+
+from main import FACT_COLUMNS, compute_metrics, intersect_rows, normalize_metrics_query
+from benchmark_metrics_filters import make_dataset, make_fact_frames
+
+def posting_rows(dataset, table, date_range, filters):
+    # select_rows before date blocks: every matching `data` posting, merged and intersected
+    index = dataset.index(table)
+    selections = [index['data'].range_rows(*date_range)]
+    selections.extend(index[column].rows(values) for column, values in filters.items())
+    return intersect_rows(selections)
+
+def best_of(fn, repeat=5):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return result, min(timings)
+
+QUARTER = ('2023-01-01', '2023-03-31')
+QUERIES = {
+    'one quarter': {},
+    'supplier, one quarter': {'razaoSocial': ['Fornecedor 12']},
+}
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1_000_000, 5_000_000]
+    for rows in sizes:
+        dataset = make_dataset(make_fact_frames(rows, years=range(2015, 2025)))
+        dataset.cubes = {table: None for table in FACT_COLUMNS}
+        dataset.build_derived()
+        print(f"{rows} facts per table over 10 years")
+
+        for name, filters in QUERIES.items():
+            postings, postings_seconds = best_of(lambda: posting_rows(dataset, 'fato_realizado', QUARTER, filters))
+            block, block_seconds = best_of(lambda: dataset.select_rows('fato_realizado', QUARTER, filters))
+            assert np.array_equal(np.asarray(block), postings), f"{name}: the paths select different rows"
+            print(f"  {name:<24} {len(postings):>8} rows  postings {postings_seconds * 1000:8.2f} ms  "
+                  f"date block {block_seconds * 1000:8.3f} ms  ({postings_seconds / block_seconds:.0f}x)")
+
+        query = normalize_metrics_query('custom', *QUARTER, None, None, None)
+        _, seconds = best_of(lambda: compute_metrics(dataset, *query))
+        print(f"  /metrics custom quarter  {seconds * 1000:8.1f} ms")
@@ -0,0 +1,69 @@
+"""
+Benchmark: columnar fact store vs the previous list-of-dicts store.
+
+Usage: python benchmark_fact_store.py [rows]
+
+Reports, for the fact tables of a synthetic sheet:
+- resident memory of each representation (tracemalloc, after the
+  intermediates are freed)
+- the per-request conversion the previous /metrics paid (pd.DataFrame
+  from the record lists) against reading the columnar frames
+- the latency of /metrics on the columnar store
+"""
+import gc
+import json
+import sys
+import time
+import tracemalloc
+
+import pandas as pd
+
+sys.path.append('.')
+
+from main import (
+    FACT_COLUMNS, ExcelDataDatabase, build_dataset_frames, compute_metrics, excel_data_db, frame_to_records,
+    normalize_metrics_query, prepare_fact_frame
+)
+from benchmark_ingest import make_raw_sheet
+
+def resident_mib(build):
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = build()
+        gc.collect()
+        return result, tracemalloc.get_traced_memory()[0] / 1024 / 1024
+    finally:
+        tracemalloc.stop()
+
+def best_of(fn, repeat=5):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+if __name__ == "__main__":
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 300_000
+    frames = build_dataset_frames(make_raw_sheet(rows))
+    print(f"Facts: {len(frames['fato_orcamento'])} orçamento, {len(frames['fato_realizado'])} realizado")
+
+    for table in FACT_COLUMNS:
+        # Serialized copies, so each representation is built from independent objects
+        records_json = json.dumps(frame_to_records(frames[table]))
+        columns_json = json.dumps({column: frames[table][column].tolist() for column in frames[table].columns})
+
+        records, records_mib = resident_mib(lambda: json.loads(records_json))
+        columnar, columnar_mib = resident_mib(lambda: prepare_fact_frame(pd.DataFrame(json.loads(columns_json))))
+        print(f"{table}: list of dicts {records_mib:7.1f} MiB, columnar {columnar_mib:7.1f} MiB "
+              f"({records_mib / columnar_mib:.1f}x smaller)")
+
+        rebuild_seconds = best_of(lambda: pd.DataFrame(records))
+        print(f"{table}: per-request pd.DataFrame(records) {rebuild_seconds * 1000:8.1f} ms, columnar 0 ms")
+        del records, columnar
+
+    excel_data_db.save_frames(frames)
+    query = normalize_metrics_query('monthly', None, None, None, None, None)
+    metrics_seconds = best_of(lambda: compute_metrics(excel_data_db.current, *query))
+    print(f"/metrics (monthly, no filters) on the columnar store: {metrics_seconds * 1000:.1f} ms")
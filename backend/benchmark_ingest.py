@@ -0,0 +1,186 @@
+"""
+Benchmark: vectorized raw Excel ingest vs the previous row-by-row loop.
+
+Usage: python benchmark_ingest.py [rows]
+
+Builds a synthetic "Real x Orçado" sheet (as returned by pd.read_excel with
+header=None), runs both engines on it, checks that they produce the same
+tables and prints the timings. Excel parsing itself is not measured, since it
+is the same for both engines.
+"""
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.append('.')
+
+from main import (
+    DCalendario, DConta, DEstrutura, DFornecedor, ExcelDataDatabase, ExcelDataUpload,
+    FatoOrcamento, FatoRealizado, build_dataset_frames, safe_float, safe_int
+)
+from datetime import datetime
+
+HEADERS = [
+    'Ano', 'Mês', 'Mercado', 'Núcleo', 'Micro Núcleo', 'Departamento', 'Filial',
+    'Código Micro Mercado ou UC', 'Micro Mercado ou UC', 'Custos FPO (novo)', 'Custos FPMSVO',
+    'Custos FPMSVO Executivo', 'Código Conta Gerencial', 'Conta Gerencial',
+    'Código da Conta Contábil', 'Conta Contabil', 'VA', 'Vlr Orçado', 'Valor DRE', 'Pacote', 'Subpacote'
+]
+
+def br_number(value):
+    text = f"{value:,.2f}"
+    return text.replace(',', 'X').replace('.', ',').replace('X', '.')
+
+def make_raw_sheet(rows, seed=42):
+    rng = np.random.default_rng(seed)
+    anos = rng.choice([2022, 2023, 2024], rows).astype(object)
+    anos[rng.random(rows) < 0.01] = 'Total'
+    meses = rng.integers(1, 13, rows)
+    orcado = rng.normal(5000, 3000, rows).round(2)
+    orcado[rng.random(rows) < 0.2] = 0
+    dre = rng.normal(5000, 3000, rows).round(2)
+    dre[rng.random(rows) < 0.2] = 0
+    contas = rng.integers(0, 2000, rows)
+    mercados = rng.integers(0, 300, rows)
+    gerenciais = rng.integers(0, 400, rows)
+
+    body = pd.DataFrame({
+        'Ano': anos,
+        'Mês': meses,
+        'Mercado': 'Mercado',
+        'Núcleo': 'Núcleo',
+        'Micro Núcleo': 'Micro Núcleo',
+        'Departamento': [f"Dep {i % 50}" for i in range(rows)],
+        'Filial': 'Filial',
+        'Código Micro Mercado ou UC': [f"MM{m:04d}" for m in mercados],
+        'Micro Mercado ou UC': 'Micro Mercado',
+        'Custos FPO (novo)': '0',
+        'Custos FPMSVO': '0',
+        'Custos FPMSVO Executivo': '0',
+        'Código Conta Gerencial': [f"G{g}" for g in gerenciais],
+        'Conta Gerencial': [f"Conta Gerencial {g}" if g % 10 else '' for g in gerenciais],
+        'Código da Conta Contábil': [f"4.1.{c:04d}" for c in contas],
+        'Conta Contabil': 'Conta Contabil',
+        'VA': '0',
+        'Vlr Orçado': [br_number(v) for v in orcado],
+        'Valor DRE': [br_number(v) for v in dre],
+        'Pacote': [f"Pacote {i % 7}" for i in range(rows)],
+        'Subpacote': [f"Subpacote {i % 13}" for i in range(rows)],
+    })
+    body.insert(0, 'blank', np.nan)
+    header_rows = pd.DataFrame([[np.nan] * len(body.columns), [np.nan] + HEADERS], columns=body.columns)
+    raw = pd.concat([header_rows, body], ignore_index=True)
+    raw.columns = range(len(raw.columns))
+    return raw
+
+def legacy_ingest(df):
+    """The loop upload_raw_excel used before the vectorized engine."""
+    df = df.astype(str)
+    df.columns = df.iloc[1]
+    df = df[2:].reset_index(drop=True)
+    df = df.iloc[:, 1:]
+    records = df.to_dict('records')
+    records = [r for r in records if safe_int(r.get('Ano', 0)) > 0]
+
+    fato_orcamento_data = []
+    fato_realizado_data = []
+    for index, record in enumerate(records):
+        try:
+            ano = safe_int(record.get('Ano', 0))
+            mes = safe_int(record.get('Mês', 0))
+            departamento = str(record.get('Departamento', '')) if pd.notna(record.get('Departamento', '')) else ''
+            codigoMicroMercado = str(record.get('Código Micro Mercado ou UC', '')) if pd.notna(record.get('Código Micro Mercado ou UC', '')) else ''
+            contaGerencial = str(record.get('Conta Gerencial', '')) if pd.notna(record.get('Conta Gerencial', '')) else ''
+            codigoContaContabil = str(record.get('Código da Conta Contábil', '')) if pd.notna(record.get('Código da Conta Contábil', '')) else ''
+            vlrOrcado = safe_float(record.get('Vlr Orçado', 0))
+            valorDRE = safe_float(record.get('Valor DRE', 0))
+            pacote = str(record.get('Pacote', '')) if pd.notna(record.get('Pacote', '')) else ''
+            subpacote = str(record.get('Subpacote', '')) if pd.notna(record.get('Subpacote', '')) else ''
+
+            if ano > 0 and mes > 0:
+                data_str = f"{ano}-{mes:02d}-01"
+                if vlrOrcado != 0:
+                    fato_orcamento_data.append(FatoOrcamento(
+                        id=f"orc_{index}", ano=ano, mes=mes, data=data_str,
+                        codigoMicroMercado=codigoMicroMercado, codigoConta=codigoContaContabil,
+                        vlrOrcado=vlrOrcado
+                    ))
+                if valorDRE != 0:
+                    fato_realizado_data.append(FatoRealizado(
+                        id=f"real_{index}", ano=ano, mes=mes, data=data_str,
+                        codigoMicroMercado=codigoMicroMercado, codigoConta=codigoContaContabil,
+                        razaoSocial=contaGerencial or 'Fornecedor', valorCustoTotal=valorDRE,
+                        historicoCusto=f"{departamento} - {pacote} - {subpacote}"
+                    ))
+        except Exception:
+            continue
+
+    calendario_map = {}
+    estrutura_map = {}
+    conta_map = {}
+    fornecedor_map = {}
+    for fact in fato_orcamento_data + fato_realizado_data:
+        if fact.data not in calendario_map:
+            date_obj = datetime.strptime(fact.data, "%Y-%m-%d")
+            calendario_map[fact.data] = DCalendario(
+                data=fact.data, ano=fact.ano, mes=fact.mes,
+                nomeMes=date_obj.strftime("%B"), trimestre=((fact.mes - 1) // 3) + 1
+            )
+        if fact.codigoMicroMercado and fact.codigoMicroMercado not in estrutura_map:
+            estrutura_map[fact.codigoMicroMercado] = DEstrutura(
+                codigoMicroMercado=fact.codigoMicroMercado, nomeMicroMercado=fact.codigoMicroMercado,
+                nucleo='', microNucleo='', filial='', mercado=''
+            )
+        if fact.codigoConta and fact.codigoConta not in conta_map:
+            conta_map[fact.codigoConta] = DConta(
+                codigoConta=fact.codigoConta, pacote='', subpacote='',
+                contaGerencial='', contaContabil=fact.codigoConta
+            )
+    for fact in fato_realizado_data:
+        if fact.razaoSocial and fact.razaoSocial not in fornecedor_map:
+            fornecedor_map[fact.razaoSocial] = DFornecedor(razaoSocial=fact.razaoSocial, tipoFornecedor='Fornecedor')
+
+    db = ExcelDataDatabase()
+    db.save_data(ExcelDataUpload(
+        fatoOrcamento=fato_orcamento_data,
+        fatoRealizado=fato_realizado_data,
+        dCalendario=list(calendario_map.values()),
+        dEstrutura=list(estrutura_map.values()),
+        dConta=list(conta_map.values()),
+        dFornecedor=list(fornecedor_map.values())
+    ))
+    return db
+
+def vectorized_ingest(df):
+    db = ExcelDataDatabase()
+    db.save_frames(build_dataset_frames(df))
+    return db
+
+TABLES = ['fato_orcamento', 'fato_realizado', 'd_calendario', 'd_estrutura', 'd_conta', 'd_fornecedor']
+
+def timed(fn, df):
+    start = time.perf_counter()
+    result = fn(df.copy())
+    return result, time.perf_counter() - start
+
+if __name__ == "__main__":
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 300_000
+    raw = make_raw_sheet(rows)
+    print(f"Synthetic sheet: {rows} rows")
+
+    legacy_db, legacy_seconds = timed(legacy_ingest, raw)
+    vectorized_db, vectorized_seconds = timed(vectorized_ingest, raw)
+
+    for table in TABLES:
+        legacy_rows = getattr(legacy_db.current, f"get_{table}")()
+        vectorized_rows = getattr(vectorized_db.current, f"get_{table}")()
+        if legacy_rows != vectorized_rows:
+            print(f"MISMATCH in {table}: {len(legacy_rows)} legacy vs {len(vectorized_rows)} vectorized rows")
+            sys.exit(1)
+    print(f"Outputs identical ({len(vectorized_db.current.fato_orcamento)} orçamento, {len(vectorized_db.current.fato_realizado)} realizado)")
+
+    print(f"Row loop:   {legacy_seconds:8.3f}s")
+    print(f"Vectorized: {vectorized_seconds:8.3f}s")
+    print(f"Speedup:    {legacy_seconds / vectorized_seconds:8.1f}x")
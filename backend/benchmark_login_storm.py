@@ -0,0 +1,73 @@
+"""
+Benchmark: latency of an unrelated endpoint during a login storm, with the
+password hashes on the event loop (as before) and on the hashing pool.
+
+Usage: python benchmark_login_storm.py [logins]
+
+Sends the logins (default 200) concurrently through the ASGI app in this
+process while a probe requests /setores every 5 ms, then prints
+the login throughput and the probe's latency percentiles. With the hashes on
+the event loop, a probe that falls due waits behind the running hashes;
+its latency is measured from when it was due.
+"""
+import asyncio
+import sys
+import time
+
+import httpx
+import numpy as np
+
+sys.path.append('.')
+
+import main
+
+PROBE_INTERVAL = 0.005
+
+class InlineHasher:
+    # Hashes on the event loop, as login did before the hashing pool
+    async def run(self, fn, *args):
+        return fn(*args)
+
+    async def rehash(self, password, hashed):
+        return main.get_password_hash(password) if main.pwd_context.needs_update(hashed) else None
+
+async def storm(logins, hasher):
+    main.password_hasher = hasher
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        credentials = {'email': 'admin@example.com', 'password': 'admin123'}
+        latencies = []
+        done = asyncio.Event()
+
+        async def probe():
+            due = time.perf_counter()
+            while not done.is_set():
+                response = await client.get('/setores')
+                # Measured from when the probe was due, so time spent waiting for the event loop counts
+                finished = time.perf_counter()
+                latencies.append(finished - due)
+                assert response.status_code == 200
+                due = finished + PROBE_INTERVAL
+                await asyncio.sleep(PROBE_INTERVAL)
+
+        prober = asyncio.create_task(probe())
+        await asyncio.sleep(0.05)
+        start = time.perf_counter()
+        responses = await asyncio.gather(*(client.post('/login', json=credentials) for _ in range(logins)))
+        seconds = time.perf_counter() - start
+        done.set()
+        await prober
+        assert all(response.status_code == 200 for response in responses)
+        return seconds, np.array(latencies) * 1000
+
+if __name__ == "__main__":
+    logins = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    pool = main.password_hasher
+    # The storm comes from one client; admission control would turn most of it away
+    main.admission_controls['login'] = main.AdmissionControl('login', 0, 0, 0)
+    print(f"{logins} concurrent logins, {main.PASSWORD_HASH_WORKERS} hashing workers")
+    for name, hasher in (('hashing on the event loop', InlineHasher()), ('hashing pool', pool)):
+        seconds, latencies = asyncio.run(storm(logins, hasher))
+        print(f"  {name:<26} {logins / seconds:7.1f} logins/s   /setores p50 {np.percentile(latencies, 50):7.1f} ms"
+              f"  p99 {np.percentile(latencies, 99):7.1f} ms  max {latencies.max():7.1f} ms  ({len(latencies)} probes)")
+    print(f"  pool stats: {pool.stats()}")
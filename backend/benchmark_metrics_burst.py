@@ -0,0 +1,59 @@
+"""
+Load test: a burst of identical concurrent /metrics requests with and without
+single-flight coalescing.
+
+Usage: python benchmark_metrics_burst.py [rows] [concurrent_requests]
+
+Builds a synthetic dataset, then fires the same /metrics request from many
+clients at once through the ASGI app, first letting each request compute its
+own result and then coalescing them. The result cache is disabled so every
+burst starts cold. Reports wall time, process CPU time (all threads) and how
+many computations ran.
+"""
+import asyncio
+import os
+import sys
+import time
+
+os.environ.setdefault('SNAPSHOT_DIR', '')
+
+import httpx
+
+sys.path.append('.')
+
+import main
+from benchmark_metrics_filters import make_fact_frames
+
+class NoCoalescing(main.SingleFlight):
+    # Every caller runs its own computation, as before coalescing
+    async def run(self, key, fn, *args):
+        self.computations += 1
+        return await main.run_in_threadpool(fn, *args)
+
+async def burst(requests):
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+        login = await client.post('/login', json={'email': 'admin@example.com', 'password': 'admin123'})
+        headers = {'Authorization': f"Bearer {login.json()['access_token']}"}
+
+        wall, cpu = time.perf_counter(), time.process_time()
+        responses = await asyncio.gather(*(client.get('/metrics', headers=headers) for _ in range(requests)))
+        wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+    assert all(response.status_code == 200 for response in responses)
+    assert len({response.content for response in responses}) == 1, "burst responses differ"
+    return wall, cpu
+
+if __name__ == "__main__":
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    requests = int(sys.argv[2]) if len(sys.argv) > 2 else 30
+    main.excel_data_db.save_frames(make_fact_frames(rows))
+    main.excel_data_db.current.build_derived()
+    main.metrics_cache.max_bytes = 0
+    # The burst comes from one user; admission control would turn part of it away
+    main.admission_controls['metrics'] = main.AdmissionControl('metrics', 0, 0, 0)
+
+    for name, flights in (('one computation per request', NoCoalescing()), ('coalesced', main.SingleFlight())):
+        main.metrics_flights = flights
+        wall, cpu = asyncio.run(burst(requests))
+        print(f"{requests} identical requests, {name:<28} wall {wall:7.2f}s  cpu {cpu:7.2f}s  "
+              f"computations {flights.computations:>3}  coalesced {flights.coalesced:>3}")
@@ -0,0 +1,85 @@
+"""
+Benchmark: /metrics answered from the rollup cubes vs from the raw facts.
+
+Usage: python benchmark_metrics_cube.py [rows ...]
+
+Builds synthetic fact tables (default 1M facts per table; 60 accounts, 10
+markets and 20 suppliers, so facts repeat their cube cell as real workbook
+rows do across departments and packages), checks that both paths return the
+same figures and prints the /metrics latency of a few dashboard queries.
+"""
+import math
+import sys
+import time
+
+sys.path.append('.')
+
+from main import CUBE_MAX_RATIO, FACT_COLUMNS, compute_metrics, normalize_metrics_query
+from benchmark_metrics_filters import make_dataset, make_fact_frames
+
+QUERIES = {
+    'monthly': dict(period='monthly'),
+    'annual, one account': dict(period='annual', accounts='4.1.0042'),
+    'daily, two suppliers': dict(period='daily', suppliers='Fornecedor 3,Fornecedor 7'),
+    'custom quarter, market': dict(period='custom', start_date='2023-01-01', end_date='2023-03-31', markets='MM0004'),
+}
+
+def run(dataset, **query):
+    params = dict(period='monthly', start_date=None, end_date=None, suppliers=None, accounts=None, markets=None)
+    return compute_metrics(dataset, *normalize_metrics_query(**{**params, **query}))
+
+def best_of(fn, repeat=5):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return result, min(timings)
+
+def assert_close(a, b, path=''):
+    if isinstance(a, dict):
+        assert list(a) == list(b), path
+        for key in a:
+            assert_close(a[key], b[key], f"{path}.{key}")
+    elif isinstance(a, list):
+        assert len(a) == len(b), path
+        for i, (x, y) in enumerate(zip(a, b)):
+            assert_close(x, y, f"{path}[{i}]")
+    elif isinstance(a, float):
+        # Sums of partial sums differ from the direct sums only by rounding
+        assert math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-6), (path, a, b)
+    else:
+        assert a == b, (path, a, b)
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1_000_000]
+    for rows in sizes:
+        frames = make_fact_frames(rows, accounts=60, markets=10, suppliers=20)
+        cube_dataset = make_dataset(frames)
+        start = time.perf_counter()
+        cube_dataset.build_derived()
+        build_seconds = time.perf_counter() - start
+        facts_dataset = make_dataset(frames)
+        facts_dataset.cubes = {table: None for table in FACT_COLUMNS}
+        facts_dataset.build_derived()
+        cubes = {table: cube_dataset.cube(table) for table in FACT_COLUMNS}
+        dropped = [table for table, cube in cubes.items() if cube is None]
+        if dropped:
+            # Too many distinct cells: the dataset keeps serving /metrics from the facts
+            print(f"{rows} facts per table; no cube kept for {', '.join(dropped)} "
+                  f"(more than CUBE_MAX_RATIO={CUBE_MAX_RATIO} cells per fact), skipping the cube path")
+            continue
+        print(f"{rows} facts per table; cubes of {len(cubes['fato_orcamento'])} and "
+              f"{len(cubes['fato_realizado'])} rows built with their indexes in {build_seconds:.2f}s")
+
+        for name, query in QUERIES.items():
+            from_cube, cube_seconds = best_of(lambda: run(cube_dataset, **query))
+            from_facts, facts_seconds = best_of(lambda: run(facts_dataset, **query))
+            assert from_cube.pop('served_from') == 'cube' and from_facts.pop('served_from') == 'facts'
+            from_cube.pop('dataset_version'), from_facts.pop('dataset_version')
+            # Ties in the top suppliers may come out in either order
+            for result in (from_cube, from_facts):
+                result['top_suppliers'].sort(key=lambda row: (-round(row['valor'], 4), row['razaoSocial']))
+            assert_close(from_facts, from_cube)
+            print(f"  {name:<24} facts {facts_seconds * 1000:8.1f} ms  cube {cube_seconds * 1000:8.1f} ms  "
+                  f"({facts_seconds / cube_seconds:.1f}x)")
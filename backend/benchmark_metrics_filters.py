@@ -0,0 +1,90 @@
+"""
+Benchmark: /metrics dimension and date filters through the posting indexes vs
+scanning the columns with isin and string comparisons.
+
+Usage: python benchmark_metrics_filters.py [rows ...]
+
+Builds synthetic fact tables of each size (default 100k and 1M facts per
+table), checks that both paths select the same rows and prints the filter
+time of a few typical dashboard queries.
+"""
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.append('.')
+
+from main import DatasetVersion, DIMENSION_KEYS, build_dimension_frames, partition_fact_frame, prepare_fact_frames
+
+def make_fact_frames(rows, seed=42, accounts=2000, markets=300, suppliers=400, years=(2022, 2023, 2024)):
+    # Fact tables shaped like the ingested ones, over 3 years by default
+    rng = np.random.default_rng(seed)
+    frames = {}
+    for table, value_column in (('fato_orcamento', 'vlrOrcado'), ('fato_realizado', 'valorCustoTotal')):
+        ano = rng.choice(list(years), rows)
+        mes = rng.integers(1, 13, rows)
+        frame = pd.DataFrame({
+            'id': [f"{table[5:8]}_{i}" for i in range(rows)],
+            'ano': ano,
+            'mes': mes,
+            'data': [f"{a}-{m:02d}-01" for a, m in zip(ano, mes)],
+            'codigoMicroMercado': [f"MM{m:04d}" for m in rng.integers(0, markets, rows)],
+            'codigoConta': [f"4.1.{c:04d}" for c in rng.integers(0, accounts, rows)],
+        })
+        if table == 'fato_realizado':
+            frame['razaoSocial'] = [f"Fornecedor {s}" for s in rng.integers(0, suppliers, rows)]
+        frame[value_column] = rng.normal(5000, 3000, rows).round(2)
+        if table == 'fato_realizado':
+            frame['historicoCusto'] = [f"Dep {d} - Pacote {d % 7}" for d in rng.integers(0, 50, rows)]
+        frames[table] = frame
+    frames.update(build_dimension_frames(frames['fato_orcamento'], frames['fato_realizado']))
+    return prepare_fact_frames(frames)
+
+def make_dataset(frames):
+    return DatasetVersion(
+        None, {name: [] for name in DIMENSION_KEYS},
+        partition_fact_frame(frames['fato_orcamento']), partition_fact_frame(frames['fato_realizado']),
+        flattened={'fato_orcamento': frames['fato_orcamento'], 'fato_realizado': frames['fato_realizado']}
+    )
+
+def scan(frame, date_range, filters):
+    mask = np.ones(len(frame), dtype=bool)
+    if date_range:
+        mask &= ((frame['data'] >= date_range[0]) & (frame['data'] <= date_range[1])).to_numpy()
+    for column, values in filters.items():
+        mask &= frame[column].isin(values).to_numpy()
+    return frame[mask]
+
+def best_of(fn, repeat=7):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return result, min(timings)
+
+QUERIES = {
+    'one account': (None, {'codigoConta': ['4.1.0042']}),
+    'account + market': (None, {'codigoConta': ['4.1.0042'], 'codigoMicroMercado': ['MM0007']}),
+    '5 accounts': (None, {'codigoConta': [f"4.1.{c:04d}" for c in range(100, 105)]}),
+    'supplier, one quarter': (('2023-01-01', '2023-03-31'), {'razaoSocial': ['Fornecedor 12']}),
+    'one quarter': (('2023-01-01', '2023-03-31'), {}),
+}
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or [100_000, 1_000_000]
+    for rows in sizes:
+        dataset = make_dataset(make_fact_frames(rows))
+        start = time.perf_counter()
+        dataset.build_derived()
+        print(f"{rows} facts per table, indexes and cubes built in {time.perf_counter() - start:.3f}s")
+
+        frame = dataset.fato_realizado
+        for name, (date_range, filters) in QUERIES.items():
+            scanned, scan_seconds = best_of(lambda: scan(frame, date_range, filters))
+            indexed, index_seconds = best_of(lambda: dataset.filter_facts('fato_realizado', date_range, filters))
+            assert indexed.equals(scanned), f"{name}: index and scan select different rows"
+            print(f"  {name:<22} {len(indexed):>8} rows  scan {scan_seconds * 1000:8.2f} ms  "
+                  f"index {index_seconds * 1000:8.2f} ms  ({scan_seconds / index_seconds:.0f}x)")
@@ -0,0 +1,66 @@
+"""
+Benchmark: cold start with and without FAST_STARTUP.
+
+Usage: python benchmark_startup.py [runs]
+
+For each mode (best of the given number of runs, default 3), measures the time
+to import main in a fresh interpreter, and the time from launching uvicorn to
+the first answered request, followed by the latency of the first /login (which
+needs the master admin hash). Snapshots are disabled, so no dataset is loaded.
+"""
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+IMPORT_MAIN = "import time; start = time.perf_counter(); import main; print(time.perf_counter() - start)"
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def import_seconds(env):
+    output = subprocess.run([sys.executable, '-c', IMPORT_MAIN], env=env, capture_output=True, text=True, check=True)
+    return float(output.stdout.strip().splitlines()[-1])
+
+def first_requests(env):
+    port = free_port()
+    base = f"http://127.0.0.1:{port}"
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'main:app', '--port', str(port), '--log-level', 'warning'],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        while True:
+            try:
+                urllib.request.urlopen(f"{base}/setores", timeout=1).read()
+                break
+            except (urllib.error.URLError, ConnectionError):
+                if server.poll() is not None:
+                    raise RuntimeError("uvicorn exited during startup")
+                time.sleep(0.005)
+        first_request = time.perf_counter() - start
+
+        credentials = json.dumps({'email': 'admin@example.com', 'password': 'admin123'}).encode()
+        login = urllib.request.Request(f"{base}/login", data=credentials, headers={'Content-Type': 'application/json'})
+        start = time.perf_counter()
+        urllib.request.urlopen(login, timeout=30).read()
+        return first_request, time.perf_counter() - start
+    finally:
+        server.terminate()
+        server.wait()
+
+if __name__ == "__main__":
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    for name, fast in (('default', ''), ('FAST_STARTUP=1', '1')):
+        env = {**os.environ, 'FAST_STARTUP': fast, 'SNAPSHOT_DIR': ''}
+        imported = min(import_seconds(env) for _ in range(runs))
+        first_request, first_login = min(first_requests(env) for _ in range(runs))
+        print(f"{name:<16} import main {imported * 1000:7.0f} ms   launch to first request {first_request * 1000:7.0f} ms"
+              f"   first /login {first_login * 1000:6.0f} ms")
@@ -0,0 +1,86 @@
+"""
+Memory profile: streaming raw Excel ingest vs pd.read_excel on the whole workbook.
+
+Usage: python benchmark_streaming_memory.py [base_rows] [chunk_rows]
+
+Writes two synthetic workbooks (base_rows and 4 * base_rows rows) and measures
+the tracemalloc peak of:
+- parsing alone: the fact chunks are consumed and discarded, so this peak must
+  stay flat as the workbook grows;
+- build_dataset_frames_streaming, which /upload-raw-excel?streaming=true and
+  the ingest jobs run. Its result grows with the workbook, and so does this
+  peak, but it must stay below the in-memory one;
+- pd.read_excel on the whole workbook plus build_dataset_frames.
+"""
+import io
+import os
+import sys
+import tempfile
+import tracemalloc
+
+import numpy as np
+import openpyxl
+import pandas as pd
+
+sys.path.append('.')
+
+from main import build_dataset_frames, build_dataset_frames_streaming, iter_fact_chunks, safe_float_series
+from benchmark_ingest import make_raw_sheet
+
+def write_workbook(rows):
+    raw = make_raw_sheet(rows)
+    # Real exports store the amounts as numeric cells, not text
+    for column in (18, 19):
+        raw.loc[2:, column] = safe_float_series(raw.loc[2:, column])
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet('Real x Orçado')
+    for row in raw.itertuples(index=False):
+        sheet.append([None if isinstance(value, float) and np.isnan(value) else value for value in row])
+    path = tempfile.NamedTemporaryFile(suffix='.xlsx', delete=False).name
+    workbook.save(path)
+    return path
+
+def peak_mib(fn):
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1] / 1024 / 1024
+    finally:
+        tracemalloc.stop()
+
+def parsing(path, chunk_rows):
+    def run():
+        for fato_orcamento, fato_realizado in iter_fact_chunks(path, chunk_rows):
+            pass
+    return run
+
+def streaming(path, chunk_rows):
+    return lambda: build_dataset_frames_streaming(path, chunk_rows)
+
+def in_memory(path):
+    def run():
+        with open(path, 'rb') as f:
+            contents = f.read()
+        return build_dataset_frames(pd.read_excel(io.BytesIO(contents), sheet_name=0, header=None))
+    return run
+
+if __name__ == "__main__":
+    base_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    chunk_rows = int(sys.argv[2]) if len(sys.argv) > 2 else 2_500
+
+    results = {}
+    for rows in (base_rows, base_rows * 4):
+        path = write_workbook(rows)
+        try:
+            results[rows] = [peak_mib(run) for run in (parsing(path, chunk_rows), streaming(path, chunk_rows), in_memory(path))]
+        finally:
+            os.remove(path)
+        print(f"{rows:>8} rows: parsing peak {results[rows][0]:7.1f} MiB, streaming build peak {results[rows][1]:7.1f} MiB, "
+              f"in-memory peak {results[rows][2]:7.1f} MiB")
+
+    small, large = results[base_rows], results[base_rows * 4]
+    growth = large[0] / small[0]
+    print(f"Parsing peak growth for 4x rows: {growth:.2f}x (streaming build: {large[1] / small[1]:.2f}x, "
+          f"in-memory: {large[2] / small[2]:.2f}x)")
+    assert growth < 1.5, "parsing peak memory should not grow with the workbook size"
+    assert large[1] < large[2], "the streaming build should peak below the in-memory ingest"
@@ -0,0 +1,57 @@
+"""
+Benchmark: warm start from a dataset snapshot vs parsing the workbook again.
+
+Usage: python benchmark_warm_start.py [rows]
+
+Writes a synthetic workbook, then measures the time until the first /metrics
+response when the dataset comes from parsing the workbook and when it comes
+from the memory-mapped snapshot written after the ingest.
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.append('.')
+
+from main import DatasetSnapshotStore, build_dataset_frames_streaming, compute_metrics, excel_data_db, normalize_metrics_query
+from benchmark_streaming_memory import write_workbook
+
+def first_metrics():
+    return compute_metrics(excel_data_db.current, *normalize_metrics_query('monthly', None, None, None, None, None))
+
+def snapshot_mib(directory):
+    return sum(entry.stat().st_size for entry in os.scandir(directory)) / 1024 / 1024
+
+if __name__ == "__main__":
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    path = write_workbook(rows)
+    snapshot_dir = tempfile.mkdtemp()
+    try:
+        start = time.perf_counter()
+        excel_data_db.save_frames(build_dataset_frames_streaming(path))
+        cold = first_metrics()
+        cold_seconds = time.perf_counter() - start
+
+        store = DatasetSnapshotStore(snapshot_dir, 1)
+        store.write(store.reserve_version(), excel_data_db.current.snapshot_frames())
+
+        start = time.perf_counter()
+        version, tables = DatasetSnapshotStore(snapshot_dir, 1).open_latest()
+        excel_data_db.load_snapshot(tables, version)
+        mapped_seconds = time.perf_counter() - start
+        warm = first_metrics()
+        warm_seconds = time.perf_counter() - start
+
+        # Same figures; only the version label differs
+        cold.pop('dataset_version')
+        warm.pop('dataset_version')
+        assert warm == cold, "metrics from the snapshot differ from the parsed workbook"
+        print(f"{rows} rows, snapshot v{version}: {snapshot_mib(os.path.join(snapshot_dir, f'v{version}')):.1f} MiB")
+        print(f"Parse workbook + first /metrics:  {cold_seconds:8.3f}s")
+        print(f"Map snapshot:                     {mapped_seconds:8.3f}s")
+        print(f"Map snapshot + first /metrics:    {warm_seconds:8.3f}s")
+    finally:
+        os.remove(path)
+        shutil.rmtree(snapshot_dir)
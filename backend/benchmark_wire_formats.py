@@ -0,0 +1,92 @@
+"""
+Benchmark: payload size and serialization time of the table endpoints in each
+wire format, against FastAPI's default JSON encoding of the row dicts.
+
+Usage: python benchmark_wire_formats.py [rows]
+
+Builds synthetic fact tables (default 200k facts per table) and encodes
+fato_realizado the way /get-fato-realizado does for each Accept value, then
+compresses each payload with gzip (and brotli, when installed) at the
+configured levels. The dataset's /metrics document is measured the same way.
+First checks that the Arrow streams of the table endpoints can be posted back
+to /upload-excel-data/bulk unchanged.
+"""
+import io
+import os
+import sys
+import time
+
+os.environ.setdefault('SNAPSHOT_DIR', '')
+
+import pyarrow.ipc
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from fastapi.testclient import TestClient
+
+sys.path.append('.')
+
+from main import (
+    ARROW_MEDIA_TYPE, BULK_TABLES, DOCUMENT_MEDIA_TYPES, TABLE_MEDIA_TYPES, app, brotli, compress_body, compute_metrics,
+    encode_metrics, encode_table, excel_data_db, frame_to_records, normalize_metrics_query
+)
+from benchmark_metrics_filters import make_dataset, make_fact_frames
+
+def best_of(fn, repeat=3):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return result, min(timings)
+
+def report(name, encode):
+    body, seconds = best_of(encode)
+    line = f"  {name:<38} {len(body) / 1024 / 1024:8.2f} MiB {seconds * 1000:9.1f} ms"
+    for encoding in ('gzip', 'br') if brotli else ('gzip',):
+        (compressed, _), compress_seconds = best_of(lambda: compress_body(body, encoding))
+        line += f"   {encoding} {len(compressed) / 1024 / 1024:7.2f} MiB +{compress_seconds * 1000:7.1f} ms"
+    print(line)
+
+def dataset_records():
+    return {name: getattr(excel_data_db.current, f"get_{name}")() for name, _ in BULK_TABLES.values()}
+
+def check_arrow_round_trip(frames):
+    # Download every table as Arrow and upload the streams as they are, named by the bulk table keys
+    excel_data_db.save_frames(frames)
+    expected = dataset_records()
+    client = TestClient(app)
+    login = client.post('/login', json={'email': 'admin@example.com', 'password': 'admin123'})
+    headers = {'Authorization': f"Bearer {login.json()['access_token']}"}
+    upload = io.BytesIO()
+    for table, (name, _) in BULK_TABLES.items():
+        response = client.get(f"/get-{name.replace('_', '-')}", headers={**headers, 'Accept': ARROW_MEDIA_TYPE})
+        arrow_table = pyarrow.ipc.open_stream(response.content).read_all()
+        arrow_table = arrow_table.replace_schema_metadata({b'table': table.encode()})
+        with pyarrow.ipc.new_stream(upload, arrow_table.schema) as writer:
+            writer.write_table(arrow_table)
+    response = client.post(
+        '/upload-excel-data/bulk', content=upload.getvalue(), headers={**headers, 'Content-Type': ARROW_MEDIA_TYPE}
+    )
+    assert response.status_code == 200, response.text
+    assert dataset_records() == expected, "the uploaded Arrow streams changed the dataset"
+    print("Arrow download -> bulk upload round trip: ok")
+
+if __name__ == "__main__":
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    check_arrow_round_trip(make_fact_frames(20_000))
+    dataset = make_dataset(make_fact_frames(rows))
+    dataset.build_derived()
+    frame = dataset.fato_realizado
+    meta = {"dataset_version": dataset.id}
+
+    print(f"fato_realizado, {rows} rows")
+    report('FastAPI jsonable_encoder (before)',
+           lambda: JSONResponse(content=jsonable_encoder({"data": frame_to_records(frame), **meta})).body)
+    for media_type in TABLE_MEDIA_TYPES:
+        report(media_type, lambda: encode_table(media_type, frame, meta))
+
+    content = compute_metrics(dataset, *normalize_metrics_query('monthly', None, None, None, None, None))
+    print("/metrics, monthly")
+    report('FastAPI jsonable_encoder (before)', lambda: JSONResponse(content=jsonable_encoder(content)).body)
+    for media_type in DOCUMENT_MEDIA_TYPES:
+        report(media_type, lambda: encode_metrics(media_type, content))
@@ -0,0 +1,23 @@
+"""
+Chooses the pbkdf2_sha256 rounds for this host.
+
+Usage: python calibrate_password_hash.py [target_ms]
+
+Measures the hash cost here and prints the rounds whose verify takes about
+target_ms (default 100), as the PASSWORD_HASH_ROUNDS setting to deploy. Logins
+then replace the hashes made with fewer rounds. Run it on the production
+hardware; a slower host needs fewer rounds for the same login latency.
+"""
+import sys
+
+sys.path.append('.')
+
+from main import PASSWORD_HASH_ROUNDS, calibrate_password_rounds, pwd_context
+
+if __name__ == "__main__":
+    target_ms = float(sys.argv[1]) if len(sys.argv) > 1 else 100.0
+    rounds, verify_ms = calibrate_password_rounds(target_ms)
+    current = pwd_context.handler().default_rounds
+    print(f"Current rounds: {current}{'' if PASSWORD_HASH_ROUNDS else ' (passlib default)'}")
+    print(f"Target verify latency: {target_ms:.0f} ms; measured {verify_ms:.1f} ms with {rounds} rounds")
+    print(f"PASSWORD_HASH_ROUNDS={rounds}")
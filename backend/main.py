@@ -1,24 +1,73 @@
-from fastapi import FastAPI, HTTPException, Depends, status, UploadFile, File
+from fastapi import FastAPI, HTTPException, Depends, status, Request, Response
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.encoders import jsonable_encoder
 from pydantic import BaseModel, EmailStr
 from typing import Optional, List
-import firebase_admin
-from firebase_admin import credentials, auth, firestore
 import os
+import importlib
 import json
 from passlib.context import CryptContext
-import httpx
 import base64
-import google.generativeai as genai
-import pandas as pd
 import io
+import math
+import tempfile
+import time
+import uuid
+import hashlib
+import shutil
+import gzip
+import threading
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+import asyncio
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import UploadFile
+import orjson
+import msgpack
+try:
+    import brotli
+except ImportError:  # responses fall back to gzip
+    brotli = None
+try:
+    import fcntl
+except ImportError:  # Windows: snapshot publishing is only serialized within the process
+    fcntl = None
+
+# Cold starts (autoscaling, serverless): the analytics, AI, Firebase and HTTP client libraries are
+# imported on first use, the Gemini model is built on the first chat and the master admin password
+# is hashed on first use. The first request that needs each pays for it instead.
+FAST_STARTUP = os.getenv("FAST_STARTUP", "").lower() in ("1", "true", "yes")
+
+class LazyModule:
+    # Stands in for a module bound to `alias` in this module until one of its attributes is read,
+    # then imports it and rebinds the alias to the module itself
+    def __init__(self, name, alias):
+        self._name = name
+        self._alias = alias
+
+    def __getattr__(self, attr):
+        module = importlib.import_module(self._name)
+        globals()[self._alias] = module
+        return getattr(module, attr)
+
+def load_module(name, alias):
+    return LazyModule(name, alias) if FAST_STARTUP else importlib.import_module(name)
+
+firebase_admin = load_module('firebase_admin', 'firebase_admin')
+credentials = load_module('firebase_admin.credentials', 'credentials')
+auth = load_module('firebase_admin.auth', 'auth')
+firestore = load_module('firebase_admin.firestore', 'firestore')
+httpx = load_module('httpx', 'httpx')
+genai = load_module('google.generativeai', 'genai')
+pd = load_module('pandas', 'pd')
+np = load_module('numpy', 'np')
+openpyxl = load_module('openpyxl', 'openpyxl')
 
 # Configure Gemini API
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-if GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
-else:
+if not GEMINI_API_KEY:
     print("WARNING: GEMINI_API_KEY not set. Chat functionality will be disabled.")
     GEMINI_API_KEY = None
 
@@ -34,20 +83,209 @@ from jose import JWTError, jwt
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-here")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+TOKEN_CACHE_MAX_ENTRIES = int(os.getenv("TOKEN_CACHE_MAX_ENTRIES", "10000"))  # 0 disables the cache
+# pbkdf2_sha256 rounds for this host, from calibrate_password_hash.py; unset keeps passlib's default.
+# Logins replace hashes made with fewer rounds.
+PASSWORD_HASH_ROUNDS = int(os.getenv("PASSWORD_HASH_ROUNDS", "0")) or None
+# Password hashes computed at once, on threads off the event loop (hashlib's pbkdf2 releases the GIL)
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+
+# Raw Excel ingest setup
+RAW_EXCEL_CHUNK_ROWS = int(os.getenv("RAW_EXCEL_CHUNK_ROWS", "20000"))
+UPLOAD_SPOOL_CHUNK_BYTES = 1024 * 1024
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+# Background ingest jobs accepted but not finished on this worker; beyond it async uploads get a 503
+INGEST_MAX_PENDING_JOBS = int(os.getenv("INGEST_MAX_PENDING_JOBS", "4"))
+INGEST_CACHE_DIR = os.getenv("INGEST_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "ingest-cache"))
+# Ingest job records, shared by the workers; a job is forgotten INGEST_JOB_TTL_SECONDS after its last update
+INGEST_JOB_DIR = os.getenv("INGEST_JOB_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "ingest-jobs"))
+INGEST_JOB_TTL_SECONDS = int(os.getenv("INGEST_JOB_TTL_SECONDS", "86400"))
+INGEST_CACHE_MAX_BYTES = int(os.getenv("INGEST_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))  # 0 disables the cache
+
+METRICS_CACHE_MAX_BYTES = int(os.getenv("METRICS_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))  # 0 disables the cache
+DATASET_BUNDLE_CACHE_MAX_BYTES = int(os.getenv("DATASET_BUNDLE_CACHE_MAX_BYTES", str(128 * 1024 * 1024)))  # 0 disables the cache
+
+# Compression of table and /metrics responses (gzip, or brotli when installed)
+RESPONSE_COMPRESS_MIN_BYTES = int(os.getenv("RESPONSE_COMPRESS_MIN_BYTES", "1024"))
+RESPONSE_GZIP_LEVEL = int(os.getenv("RESPONSE_GZIP_LEVEL", "5"))
+RESPONSE_BROTLI_QUALITY = int(os.getenv("RESPONSE_BROTLI_QUALITY", "5"))
+
+# Page sizes of /facts queries
+FACTS_PAGE_SIZE = int(os.getenv("FACTS_PAGE_SIZE", "1000"))
+FACTS_PAGE_MAX = int(os.getenv("FACTS_PAGE_MAX", "10000"))
+# Ordered row ids of recent /facts queries, so the pages after the first are a slice
+FACTS_ORDER_CACHE_MAX_BYTES = int(os.getenv("FACTS_ORDER_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))  # 0 disables the cache
+
+# Admission control of the CPU-heavy endpoints: (requests per second, burst) of each client (the
+# user, or the IP for /login) and requests in flight at once; 0 turns a limit off. ADMISSION_LIMITS
+# overrides them as JSON, e.g. {"metrics": [20, 60, 32]}
+ADMISSION_LIMITS = {
+    'login': (1.0, 10, 32),
+    'upload-raw-excel': (0.1, 3, 2),
+    'metrics': (10.0, 30, 64),
+    'chat': (0.5, 5, 4)
+}
+ADMISSION_LIMITS.update((endpoint, tuple(limits)) for endpoint, limits in json.loads(os.getenv("ADMISSION_LIMITS", "{}")).items())
+ADMISSION_BUSY_RETRY_SECONDS = int(os.getenv("ADMISSION_BUSY_RETRY_SECONDS", "1"))  # Retry-After of a 503
+# /login is limited per client IP. Behind reverse proxies every request comes from a proxy address, so
+# all logins would share one bucket: set this to the number of proxies in front of the app to take the
+# client from X-Forwarded-For instead (or run uvicorn with --proxy-headers --forwarded-allow-ips).
+# Only set it when the proxies overwrite or append to the header, or clients can pick their own IP.
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", "0"))
+
+# Dataset snapshots, written after each ingest and loaded on startup
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "snapshots"))  # empty disables snapshots
+SNAPSHOT_KEEP = int(os.getenv("SNAPSHOT_KEEP", "3"))
+SNAPSHOT_POLL_SECONDS = float(os.getenv("SNAPSHOT_POLL_SECONDS", "1"))  # how often workers look for versions published by others
 
 # Gemini setup
-model = genai.GenerativeModel('gemini-pro')
-
-pwd_context = CryptContext(schemes=["pbkdf2_sha256"], deprecated="auto", default="pbkdf2_sha256")
+_model = None
+_model_lock = threading.Lock()
+
+def get_model():
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                if GEMINI_API_KEY:
+                    genai.configure(api_key=GEMINI_API_KEY)
+                _model = genai.GenerativeModel('gemini-pro')
+    return _model
+
+if not FAST_STARTUP:
+    get_model()
+
+def make_password_context(rounds=None):
+    # With rounds, hashes made with fewer count as outdated (needs_update); stronger ones are kept
+    settings = {'pbkdf2_sha256__default_rounds': rounds, 'pbkdf2_sha256__min_rounds': rounds} if rounds else {}
+    return CryptContext(schemes=["pbkdf2_sha256"], deprecated="auto", default="pbkdf2_sha256", **settings)
+
+pwd_context = make_password_context(PASSWORD_HASH_ROUNDS)
 security = HTTPBearer()
 
+def calibrate_password_rounds(target_ms, samples=5, probe_rounds=20000):
+    """
+    pbkdf2_sha256 rounds whose verify takes about target_ms on this host,
+    never fewer than passlib's default, and the verify time measured with
+    them. The cost is linear in the rounds, so one probe sets the estimate
+    and one measurement corrects it.
+    """
+    def verify_ms(rounds):
+        context = make_password_context(rounds)
+        hashed = context.hash("calibration")
+        timings = []
+        for _ in range(samples):
+            started = time.perf_counter()
+            context.verify("calibration", hashed)
+            timings.append(time.perf_counter() - started)
+        return min(timings) * 1000
+
+    floor = make_password_context().handler().default_rounds
+    rounds = probe_rounds
+    for _ in range(2):
+        rounds = max(floor, int(rounds * target_ms / verify_ms(rounds)) // 1000 * 1000)
+    return rounds, verify_ms(rounds)
+
+class PasswordHasher:
+    """
+    Runs password hashing and verification on a dedicated thread pool, so the
+    pbkdf2 rounds of a login storm never block the event loop and at most
+    `workers` of them run at once. Calls beyond that queue for a worker; the
+    time they wait is recorded.
+    """
+    def __init__(self, workers, window=1024):
+        self.workers = workers
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash')
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.calls = 0
+        self.queue_seconds = 0.0
+        self.hash_seconds = 0.0
+        self.rehashed = 0
+        # Queue times of the latest calls, for percentiles
+        self.recent = deque(maxlen=window)
+        # {function name: (calls, seconds, durations of the latest calls)}
+        self.operations = {}
+
+    def _call(self, submitted, fn, args):
+        started = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            elapsed = time.perf_counter() - started
+            with self.lock:
+                self.calls += 1
+                self.queue_seconds += started - submitted
+                self.hash_seconds += elapsed
+                self.recent.append(started - submitted)
+                calls, seconds, durations = self.operations.get(fn.__name__) or (0, 0.0, deque(maxlen=self.recent.maxlen))
+                durations.append(elapsed)
+                self.operations[fn.__name__] = (calls + 1, seconds + elapsed, durations)
+
+    async def run(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        with self.lock:
+            self.in_flight += 1
+        try:
+            return await loop.run_in_executor(self.executor, self._call, time.perf_counter(), fn, args)
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+    async def rehash(self, password, hashed):
+        # A new hash of a verified password whose hash has outdated parameters, else None
+        if not pwd_context.needs_update(hashed):
+            return None
+        new_hash = await self.run(get_password_hash, password)
+        with self.lock:
+            self.rehashed += 1
+        return new_hash
+
+    def stats(self):
+        with self.lock:
+            recent = np.array(self.recent)
+            calls = self.calls
+            return {
+                'workers': self.workers,
+                'in_flight': self.in_flight,
+                'queued': max(0, self.in_flight - self.workers),
+                'calls': calls,
+                'mean_queue_ms': self.queue_seconds / calls * 1000 if calls else 0.0,
+                'p99_queue_ms': float(np.percentile(recent, 99)) * 1000 if len(recent) else 0.0,
+                'max_queue_ms': float(recent.max()) * 1000 if len(recent) else 0.0,
+                'mean_hash_ms': self.hash_seconds / calls * 1000 if calls else 0.0,
+                'scheme': pwd_context.default_scheme(),
+                'rounds': pwd_context.handler().default_rounds,
+                'rehashed': self.rehashed,
+                # verify_password is the observed verify latency
+                'operations': {
+                    name: {
+                        'calls': op_calls,
+                        'mean_ms': seconds / op_calls * 1000,
+                        'p99_ms': float(np.percentile(np.array(durations), 99)) * 1000
+                    }
+                    for name, (op_calls, seconds, durations) in self.operations.items()
+                }
+            }
+
+password_hasher = PasswordHasher(PASSWORD_HASH_WORKERS)
+
 class UserDatabase:
     def __init__(self):
         self.users = {}
         # Pre-populate with master admin user from environment variables
         master_email = os.getenv("MASTER_ADMIN_EMAIL", "admin@example.com")
         master_password = os.getenv("MASTER_ADMIN_PASSWORD", "admin123")  # Default for development
-        hashed_master_password = pwd_context.hash(master_password)
+        # A hash made ahead (pwd_context.hash) spares every start the pbkdf2 rounds
+        hashed_master_password = os.getenv("MASTER_ADMIN_PASSWORD_HASH")
+        # {email: password} hashed on the password hashing pool after startup
+        self.pending_passwords = {}
+        self.lock = threading.Lock()
+        if hashed_master_password is None:
+            if FAST_STARTUP:
+                self.pending_passwords[master_email] = master_password
+            else:
+                hashed_master_password = pwd_context.hash(master_password)
         self.users[master_email] = {
             'email': master_email,
             'full_name': 'Master Admin',
@@ -63,6 +301,17 @@ class UserDatabase:
     def get_user(self, email):
         return self.users.get(email)
 
+    def hash_pending_passwords(self):
+        # Blocks for the pbkdf2 rounds, so it runs on password_hasher. Entries are only dropped once
+        # hashed: a concurrent call waits on the lock rather than seeing a user without a hash.
+        with self.lock:
+            for email, password in list(self.pending_passwords.items()):
+                hashed = pwd_context.hash(password)
+                user = self.users.get(email)
+                if user is not None:
+                    user['password'] = hashed
+                del self.pending_passwords[email]
+
     def user_exists(self, email):
         return email in self.users
 
@@ -86,28 +335,442 @@ class FileDatabase:
 
 files_db = FileDatabase()
 
-class ExcelDataDatabase:
-    def __init__(self):
-        self.fato_orcamento = []
-        self.fato_realizado = []
-        self.d_calendario = []
-        self.d_estrutura = []
-        self.d_conta = []
-        self.d_fornecedor = []
-
-    def save_data(self, data):
-        self.fato_orcamento = [item.dict() for item in data.fatoOrcamento]
-        self.fato_realizado = [item.dict() for item in data.fatoRealizado]
-        self.d_calendario = [item.dict() for item in data.dCalendario]
-        self.d_estrutura = [item.dict() for item in data.dEstrutura]
-        self.d_conta = [item.dict() for item in data.dConta]
-        self.d_fornecedor = [item.dict() for item in data.dFornecedor]
+def frame_to_records(df):
+    # Same result as df.to_dict('records'), but converts each column to Python objects in one go
+    columns = list(df.columns)
+    values = [df[column].tolist() for column in columns]
+    return [dict(zip(columns, row)) for row in zip(*values)]
+
+# Natural key of each dimension table, used when merging incremental uploads
+DIMENSION_KEYS = {
+    'd_calendario': 'data',
+    'd_estrutura': 'codigoMicroMercado',
+    'd_conta': 'codigoConta',
+    'd_fornecedor': 'razaoSocial'
+}
+
+FACT_COLUMNS = {
+    'fato_orcamento': ['id', 'ano', 'mes', 'data', 'codigoMicroMercado', 'codigoConta', 'vlrOrcado'],
+    'fato_realizado': ['id', 'ano', 'mes', 'data', 'codigoMicroMercado', 'codigoConta', 'razaoSocial', 'valorCustoTotal', 'historicoCusto']
+}
+
+# Repeated strings stored as dictionary-encoded (categorical) columns
+CATEGORICAL_COLUMNS = ['codigoMicroMercado', 'codigoConta', 'razaoSocial', 'historicoCusto']
+
+def prepare_fact_frame(frame):
+    # Dictionary-encodes the repeated string columns and stable-sorts the rows by (ano, mes).
+    # Already prepared frames are returned without copying.
+    encode = {
+        column: 'category' for column in CATEGORICAL_COLUMNS
+        if column in frame.columns and not isinstance(frame[column].dtype, pd.CategoricalDtype)
+    }
+    if encode:
+        frame = frame.astype(encode)
+
+    ano = frame['ano'].to_numpy()
+    mes = frame['mes'].to_numpy()
+    ano_step = np.diff(ano)
+    if not ((ano_step > 0) | ((ano_step == 0) & (np.diff(mes) >= 0))).all():
+        frame = frame.take(np.lexsort((mes, ano)))
+    if not frame.index.equals(pd.RangeIndex(len(frame))):
+        frame = frame.reset_index(drop=True)
+    return frame
+
+def prepare_fact_frames(frames):
+    prepared = dict(frames)
+    for table in FACT_COLUMNS:
+        prepared[table] = prepare_fact_frame(frames[table])
+    return prepared
+
+def period_ids(frame):
+    # Ids of an incremental upload qualified by their (ano, mes) partition, after the table prefix
+    # (orc_15 -> orc_2024-03_15). Each file numbers its rows from 0, but a partition is always
+    # replaced whole by one upload, so qualified ids never collide with those of the kept ones.
+    period = frame['ano'].astype(str) + '-' + frame['mes'].astype(str).str.zfill(2)
+    parts = frame['id'].astype(str).str.extract(r'^([^_]*_)?(.*)$')
+    return parts[0].fillna('') + period + '_' + parts[1]
+
+def partition_fact_frame(frame):
+    # Splits a prepared fact frame into {(ano, mes): rows} slices that share its memory
+    ano = frame['ano'].to_numpy()
+    mes = frame['mes'].to_numpy()
+    starts = np.flatnonzero((np.diff(ano) != 0) | (np.diff(mes) != 0)) + 1
+    starts = np.concatenate(([0], starts)) if len(frame) else starts
+    ends = np.append(starts[1:], len(frame))
+    return {
+        (int(ano[start]), int(mes[start])): frame.iloc[start:end]
+        for start, end in zip(starts, ends)
+    }
+
+def concat_fact_frames(frames, table):
+    if not frames:
+        return pd.DataFrame(columns=FACT_COLUMNS[table])
+    if len(frames) == 1:
+        return frames[0].reset_index(drop=True)
+    columns = {}
+    for column in frames[0].columns:
+        parts = [frame[column] for frame in frames]
+        if isinstance(parts[0].dtype, pd.CategoricalDtype):
+            # Unify the dictionaries so the column stays encoded
+            columns[column] = pd.api.types.union_categoricals(parts, ignore_order=True)
+        else:
+            columns[column] = pd.concat(parts, ignore_index=True)
+    return pd.DataFrame(columns)
+
+def encode_key(key):
+    # Integer codes of a grouping column (-1 where missing) and the label of each code, in the
+    # order groupby lists the groups: category order, the integer range, or sorted values
+    if isinstance(key.dtype, pd.CategoricalDtype):
+        return key.cat.codes.to_numpy(), key.cat.categories
+    values = key.to_numpy()
+    if values.dtype.kind in 'iu':
+        low = int(values.min()) if len(values) else 0
+        high = int(values.max()) + 1 if len(values) else 0
+        return values - low, pd.RangeIndex(low, high)
+    codes, labels = pd.factorize(values, sort=True)
+    return codes, pd.Index(labels)
+
+def present_codes(codes, labels):
+    return np.bincount(codes[codes >= 0], minlength=len(labels)) > 0
+
+def aggregate_facts(frame, value, keys):
+    """
+    Sums of a fact column per group of each key in keys ({name: (codes,
+    labels)} from encode_key), in one grouped pass per key over the codes.
+    Each result is the frame groupby(key)[value].sum().reset_index() gives,
+    to the bit: the sums run through the same compensated groupby kernel.
+    """
+    values = pd.Series(frame[value].to_numpy())
+    aggregates = {}
+    for name, (codes, labels) in keys.items():
+        groups = pd.Categorical.from_codes(codes, categories=pd.RangeIndex(len(labels)))
+        sums = values.groupby(groups, observed=False).sum().to_numpy()
+        present = present_codes(codes, labels)
+        aggregates[name] = pd.DataFrame({name: labels[present], value: sums[present]})
+    return aggregates
+
+def distinct_values(codes, labels):
+    return labels[present_codes(codes, labels)].tolist()
+
+def month_labels(keys):
+    return [f"{key // 100}-{key % 100:02d}" for key in keys]
+
+# Columns /metrics filters on; `data` is the calendar key derived from (ano, mes)
+INDEXED_COLUMNS = ['codigoConta', 'codigoMicroMercado', 'razaoSocial', 'data']
+
+class PostingIndex:
+    # Secondary index of one fact column: the sorted row ids of every distinct value, stored
+    # CSR-style, so the rows of values[i] are row_ids[offsets[i]:offsets[i + 1]]
+    def __init__(self, series):
+        # values are in groupby order and codes[row] is the position of the row's value, so the
+        # column can be grouped without hashing it again
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            codes = series.cat.codes.to_numpy()
+            self.values = series.cat.categories
+        else:
+            codes, values = pd.factorize(series, sort=True)
+            self.values = pd.Index(values)
+        self.codes = codes
+        counts = np.bincount(codes[codes >= 0], minlength=len(self.values))
+        # A stable sort keeps the row ids of each value in ascending order; missing values (-1) come first
+        order = np.argsort(codes, kind='stable')
+        self.row_ids = order[len(codes) - counts.sum():]
+        self.offsets = np.concatenate(([0], np.cumsum(counts)))
+
+    def _rows_at(self, positions):
+        parts = [self.row_ids[self.offsets[i]:self.offsets[i + 1]] for i in positions]
+        if len(parts) == 1:
+            return parts[0]
+        # Each row has a single value, so the parts are disjoint
+        return np.sort(np.concatenate(parts)) if parts else self.row_ids[:0]
+
+    def rows(self, values):
+        positions = self.values.get_indexer(pd.Index(values).unique())
+        return self._rows_at(positions[positions >= 0])
+
+    def range_rows(self, low, high):
+        # Either bound may be None (unbounded)
+        values = self.values.to_numpy()
+        matches = np.ones(len(values), dtype=bool)
+        if low is not None:
+            matches &= values >= low
+        if high is not None:
+            matches &= values <= high
+        return self._rows_at(np.flatnonzero(matches))
+
+# Rollup of a fact table by every column /metrics filters or groups on, with the summed value and
+# the number of facts. `data` follows from (ano, mes) in ingested workbooks, so it adds no rows,
+# but keeping it makes daily and custom date range queries answerable too.
+CUBE_DIMENSIONS = ['ano', 'mes', 'data', 'codigoConta', 'codigoMicroMercado', 'razaoSocial']
+FACT_VALUES = {'fato_orcamento': 'vlrOrcado', 'fato_realizado': 'valorCustoTotal'}
+# A cube with more rows than this fraction of its table saves too little to be worth the memory
+CUBE_MAX_RATIO = 0.75
+
+def build_cube(frame, value):
+    keys = [column for column in CUBE_DIMENSIONS if column in frame.columns]
+    # dropna=False keeps facts with missing keys in the totals, as the facts themselves do
+    cube = frame.groupby(keys, observed=True, dropna=False).agg(**{value: (value, 'sum'), 'count': (value, 'size')})
+    return cube.reset_index()
+
+def intersect_rows(selections):
+    # Intersects sorted row id arrays smallest first, probing the larger ones with binary search,
+    # so the cost follows the number of matching rows rather than the table size
+    selections = sorted(selections, key=len)
+    rows = selections[0]
+    for other in selections[1:]:
+        if not len(rows) or not len(other):
+            return rows[:0]
+        positions = np.minimum(np.searchsorted(other, rows), len(other) - 1)
+        rows = rows[other[positions] == rows]
+    return rows
+
+# Dimensions offered as cascading filter options, by their /metrics parameter
+FACET_DIMENSIONS = {'suppliers': 'razaoSocial', 'accounts': 'codigoConta', 'markets': 'codigoMicroMercado'}
+# Key of the periods options for each /metrics period; daily and custom periods list `data` values
+PERIOD_FACETS = {'annual': 'ano', 'monthly': 'month'}
+
+class FacetIndex:
+    """
+    Filter options of one fact table: the values of each dimension with the
+    number of facts holding them. Built over the table's cube when it was
+    kept, where each row is a distinct combination of the dimensions weighted
+    by its count, and over the facts otherwise. The posting indexes of that
+    level are the co-occurrence postings: intersecting the postings of the
+    selected values gives the rows an option has to appear in.
+    """
+    def __init__(self, dataset, table):
+        self.table = table
+        self.level = 'facts' if dataset.cube(table) is None else 'cube'
+        frame = getattr(dataset, table) if self.level == 'facts' else dataset.cube(table)
+        self.weights = frame['count'].to_numpy() if self.level == 'cube' else None
+        # {key: (codes, labels)}, labels formatted as /metrics lists them
+        self.keys = {column: (index.codes, index.values) for column, index in dataset.index(table, self.level).items()}
+        codes, years = encode_key(frame['ano'])
+        self.keys['ano'] = (codes, pd.Index([str(year) for year in years]))
+        codes, months = encode_key(frame['ano'] * 100 + frame['mes'])
+        self.keys['month'] = (codes, pd.Index(month_labels(months)))
+        # Options of the whole table, for requests without filters
+        self.totals = {key: self.counts(key) for key in self.keys}
+
+    def counts(self, key, rows=None):
+        # Facts per value of key among rows (row ids of the level, None for all), as a Series
+        # indexed by value holding only the values that occur
+        codes, labels = self.keys[key]
+        weights = self.weights
+        if isinstance(rows, pd.RangeIndex):
+            rows = slice(rows.start, rows.stop)
+        if rows is not None:
+            codes = codes[rows]
+            weights = None if weights is None else weights[rows]
+        present = codes >= 0
+        counts = np.bincount(
+            codes[present], weights=None if weights is None else weights[present], minlength=len(labels)
+        ).astype(np.int64)
+        return pd.Series(counts, index=labels)[counts > 0]
+
+    def options(self, dataset, key, date_range=None, filters=None):
+        if not date_range and not filters:
+            return self.totals[key]
+        return self.counts(key, dataset.select_rows(self.table, date_range, filters, self.level))
+
+def merge_dimension(existing, new_rows, key):
+    merged = {row[key]: row for row in existing}
+    merged.update((row[key], row) for row in new_rows)
+    return list(merged.values())
+
+def upload_to_frames(data):
+    return {
+        'fato_orcamento': pd.DataFrame([item.dict() for item in data.fatoOrcamento], columns=FACT_COLUMNS['fato_orcamento']),
+        'fato_realizado': pd.DataFrame([item.dict() for item in data.fatoRealizado], columns=FACT_COLUMNS['fato_realizado']),
+        'd_calendario': pd.DataFrame([item.dict() for item in data.dCalendario]),
+        'd_estrutura': pd.DataFrame([item.dict() for item in data.dEstrutura]),
+        'd_conta': pd.DataFrame([item.dict() for item in data.dConta]),
+        'd_fornecedor': pd.DataFrame([item.dict() for item in data.dFornecedor])
+    }
+
+class DatasetVersion:
+    """
+    One immutable version of the dataset. Ingest builds a complete new version
+    and publishes it by swapping ExcelDataDatabase.current; each request pins a
+    version once and reads every table from it. The lazy conversions below only
+    fill in derived state, never change what the version holds.
+    """
+    def __init__(self, snapshot_version, dimensions, orcamento_partitions=None, realizado_partitions=None, flattened=None, snapshot_tables=None):
+        # Snapshot versions are shared by all workers; a version without one gets a process-local id
+        self.snapshot_version = snapshot_version
+        self.id = str(snapshot_version) if snapshot_version is not None else uuid.uuid4().hex[:12]
+        # Facts are column-oriented DataFrames split into (ano, mes) partitions;
+        # the full table is concatenated lazily, in period order
+        self.orcamento_partitions = orcamento_partitions or {}
+        self.realizado_partitions = realizado_partitions or {}
+        self.flattened = dict(flattened or {})
+        # Memory-mapped fact tables of a loaded snapshot, converted on first access
+        self.snapshot_tables = snapshot_tables
+        # {(table, level): {column: PostingIndex}} over the flattened tables ('facts') and their cubes ('cube')
+        self.indexes = {}
+        # {table: rollup cube}, None when the cube would exceed CUBE_MAX_RATIO of the table
+        self.cubes = {}
+        # {table: FacetIndex}
+        self.facet_indexes = {}
+        # {(table, level): `data` values}, None when the rows are not in date order
+        self.dates = {}
+        self.lock = threading.RLock()
+        self.d_calendario = dimensions['d_calendario']
+        self.d_estrutura = dimensions['d_estrutura']
+        self.d_conta = dimensions['d_conta']
+        self.d_fornecedor = dimensions['d_fornecedor']
+
+    @property
+    def fato_orcamento(self):
+        return self._flatten('fato_orcamento', self.partitions()[0])
+
+    @property
+    def fato_realizado(self):
+        return self._flatten('fato_realizado', self.partitions()[1])
+
+    def partitions(self):
+        self._activate_snapshot()
+        return self.orcamento_partitions, self.realizado_partitions
+
+    def _flatten(self, table, partitions):
+        frame = self.flattened.get(table)
+        if frame is None:
+            frame = concat_fact_frames([partitions[key] for key in sorted(partitions)], table)
+            self.flattened[table] = frame
+        return frame
+
+    def _activate_snapshot(self):
+        if self.snapshot_tables is None:
+            return
+        with self.lock:
+            if self.snapshot_tables is None:
+                return
+            # split_blocks keeps numeric columns and dictionary codes as read-only views of the
+            # mapped files, so workers share them through the page cache instead of copying
+            frames = {
+                table: prepare_fact_frame(self.snapshot_tables[table].to_pandas(split_blocks=True))
+                for table in FACT_COLUMNS
+            }
+            self.orcamento_partitions = partition_fact_frame(frames['fato_orcamento'])
+            self.realizado_partitions = partition_fact_frame(frames['fato_realizado'])
+            self.flattened = frames
+            self.snapshot_tables = None
+
+    def cube(self, table):
+        if table not in self.cubes:
+            with self.lock:
+                if table not in self.cubes:
+                    frame = getattr(self, table)
+                    cube = build_cube(frame, FACT_VALUES[table])
+                    self.cubes[table] = cube if len(cube) <= CUBE_MAX_RATIO * len(frame) else None
+        return self.cubes[table]
+
+    def index(self, table, level='facts'):
+        indexes = self.indexes.get((table, level))
+        if indexes is None:
+            with self.lock:
+                indexes = self.indexes.get((table, level))
+                if indexes is None:
+                    frame = getattr(self, table) if level == 'facts' else self.cube(table)
+                    indexes = {column: PostingIndex(frame[column]) for column in INDEXED_COLUMNS if column in frame.columns}
+                    self.indexes[(table, level)] = indexes
+        return indexes
+
+    def facets(self, table):
+        if table not in self.facet_indexes:
+            with self.lock:
+                if table not in self.facet_indexes:
+                    self.facet_indexes[table] = FacetIndex(self, table)
+        return self.facet_indexes[table]
+
+    def sorted_dates(self, table, level='facts'):
+        # The `data` values of the table (or of its cube) when its rows are in date order, which
+        # ingested facts are: they are sorted by (ano, mes) and `data` follows from both
+        key = (table, level)
+        if key not in self.dates:
+            with self.lock:
+                if key not in self.dates:
+                    frame = getattr(self, table) if level == 'facts' else self.cube(table)
+                    # Missing dates make the column non-monotonic
+                    dates = frame['data']
+                    self.dates[key] = dates.to_numpy() if dates.is_monotonic_increasing else None
+        return self.dates[key]
+
+    def date_block(self, table, date_range, level='facts'):
+        # Rows whose `data` is within date_range (inclusive, either bound may be None) as a
+        # RangeIndex found by binary search, or None when the rows are not in date order
+        dates = self.sorted_dates(table, level)
+        if dates is None:
+            return None
+        low, high = date_range
+        start = 0 if low is None else int(np.searchsorted(dates, low, side='left'))
+        stop = len(dates) if high is None else int(np.searchsorted(dates, high, side='right'))
+        return pd.RangeIndex(start, max(start, stop))
+
+    def key_codes(self, table, column, frame, level='facts'):
+        # encode_key for an indexed column of rows of the table (or of its cube), from the codes
+        # of its posting index; frames from filter_facts keep the row ids as their index
+        index = self.index(table, level)[column]
+        if len(frame) == len(index.codes):
+            return index.codes, index.values
+        rows = frame.index
+        if isinstance(rows, pd.RangeIndex) and rows.step == 1:
+            # A date block: the codes are a slice
+            return index.codes[rows.start:rows.stop], index.values
+        return index.codes[rows.to_numpy()], index.values
+
+    def build_derived(self):
+        # Indexes, cubes, date orders and facets, so the first queries of a new version do not pay for them
+        for table in FACT_COLUMNS:
+            self.index(table)
+            self.sorted_dates(table)
+            if self.cube(table) is not None:
+                self.index(table, 'cube')
+                self.sorted_dates(table, 'cube')
+            self.facets(table)
+
+    def select_rows(self, table, date_range=None, filters=None, level='facts'):
+        """
+        Sorted row ids of a fact table (or of its cube, with level='cube')
+        whose `data` is within date_range (inclusive, either bound may be None)
+        and whose columns hold one of the accepted values in filters, found by
+        intersecting index postings instead of scanning the columns. Rows in
+        date order turn the range into one block found by binary search: a
+        RangeIndex when nothing else filters, otherwise the bounds the postings
+        are cut to. None means every row.
+        """
+        if not date_range and not filters:
+            return None
+        index = self.index(table, level)
+        block = self.date_block(table, date_range, level) if date_range else None
+        if block is not None and not filters:
+            return block
+        selections = [index['data'].range_rows(*date_range)] if date_range and block is None else []
+        for column, values in (filters or {}).items():
+            rows = index[column].rows(values)
+            if block is not None:
+                rows = rows[np.searchsorted(rows, block.start):np.searchsorted(rows, block.stop)]
+            selections.append(rows)
+        return intersect_rows(selections)
+
+    def filter_facts(self, table, date_range=None, filters=None, level='facts'):
+        frame = getattr(self, table) if level == 'facts' else self.cube(table)
+        rows = self.select_rows(table, date_range, filters, level)
+        if isinstance(rows, pd.RangeIndex):
+            # A date block is a slice of the table, shared rather than copied
+            return frame.iloc[rows.start:rows.stop]
+        return frame if rows is None else frame.take(rows)
+
+    def snapshot_frames(self):
+        tables = {'fato_orcamento': self.fato_orcamento, 'fato_realizado': self.fato_realizado}
+        tables.update((name, getattr(self, name)) for name in DIMENSION_KEYS)
+        return tables
 
     def get_fato_orcamento(self):
-        return self.fato_orcamento
+        return frame_to_records(self.fato_orcamento)
 
     def get_fato_realizado(self):
-        return self.fato_realizado
+        return frame_to_records(self.fato_realizado)
 
     def get_d_calendario(self):
         return self.d_calendario
@@ -121,8 +784,455 @@ class ExcelDataDatabase:
     def get_d_fornecedor(self):
         return self.d_fornecedor
 
+class ExcelDataDatabase:
+    def __init__(self):
+        # The active DatasetVersion. Writers build a new version and swap this single
+        # reference; readers take it once per request and never need the lock.
+        self.current = DatasetVersion(0, {name: [] for name in DIMENSION_KEYS})
+        self.lock = threading.Lock()  # serializes writers
+
+    def save_data(self, data, version=None):
+        return self.save_frames(upload_to_frames(data), version)
+
+    def save_frames(self, frames, version=None):
+        frames = prepare_fact_frames(frames)
+        dataset = DatasetVersion(
+            version,
+            {name: frame_to_records(frames[name]) for name in DIMENSION_KEYS},
+            partition_fact_frame(frames['fato_orcamento']),
+            partition_fact_frame(frames['fato_realizado']),
+            # The prepared frames already are the flattened tables
+            flattened={table: frames[table] for table in FACT_COLUMNS}
+        )
+        with self.lock:
+            self.current = dataset
+        return dataset
+
+    def merge_frames(self, frames, version=None):
+        """
+        Incremental ingest: replaces only the (ano, mes) partitions present in the
+        new frames and merges the dimensions by their natural key. Returns the new
+        version and the sorted list of partitions that were replaced.
+        """
+        frames = prepare_fact_frames(frames)
+        new_orcamento = partition_fact_frame(frames['fato_orcamento'].assign(id=period_ids(frames['fato_orcamento'])))
+        new_realizado = partition_fact_frame(frames['fato_realizado'].assign(id=period_ids(frames['fato_realizado'])))
+        replaced = set(new_orcamento) | set(new_realizado)
+        new_dimensions = {name: frame_to_records(frames[name]) for name in DIMENSION_KEYS}
+
+        with self.lock:
+            base = self.current
+            base_orcamento, base_realizado = base.partitions()
+            orcamento_partitions = {key: facts for key, facts in base_orcamento.items() if key not in replaced}
+            orcamento_partitions.update(new_orcamento)
+            realizado_partitions = {key: facts for key, facts in base_realizado.items() if key not in replaced}
+            realizado_partitions.update(new_realizado)
+            dimensions = {
+                name: merge_dimension(getattr(base, name), new_dimensions[name], key)
+                for name, key in DIMENSION_KEYS.items()
+            }
+            dataset = DatasetVersion(version, dimensions, orcamento_partitions, realizado_partitions)
+            self.current = dataset
+        return dataset, sorted(replaced)
+
+    def load_snapshot(self, tables, version):
+        """
+        Activates a memory-mapped snapshot unless the active version is already
+        that one or newer. Dimensions are small and converted right away; the
+        facts stay mapped until first used. Returns whether it was loaded.
+        """
+        dataset = DatasetVersion(
+            version,
+            {name: frame_to_records(tables[name].to_pandas()) for name in DIMENSION_KEYS},
+            snapshot_tables={table: tables[table] for table in FACT_COLUMNS}
+        )
+        with self.lock:
+            active = self.current.snapshot_version
+            if active is not None and version <= active:
+                return False
+            self.current = dataset
+        return True
+
 excel_data_db = ExcelDataDatabase()
 
+# Bump when the raw Excel parser's output changes, so frames cached by an older parser are not reused
+INGEST_PARSER_VERSION = 3
+
+class ParsedDatasetCache:
+    """
+    On-disk cache of parsed dataset frames keyed by the SHA-256 of the uploaded
+    file and the parser version, with LRU eviction. Each entry is a directory of
+    Feather files, one per table, so reading one back never runs code from disk.
+    """
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # digest -> size in bytes, least recently used first
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+        if max_bytes > 0 and os.path.isdir(directory):
+            prefix = self._name('')
+            cached = [entry for entry in os.scandir(directory) if entry.is_dir() and entry.name.startswith(prefix)]
+            for entry in sorted(cached, key=lambda entry: entry.stat().st_mtime):
+                self.entries[entry.name[len(prefix):]] = self._size(entry.path)
+
+    def _name(self, digest):
+        return f"v{INGEST_PARSER_VERSION}-{digest}"
+
+    def _path(self, digest):
+        return os.path.join(self.directory, self._name(digest))
+
+    @staticmethod
+    def _size(path):
+        return sum(entry.stat().st_size for entry in os.scandir(path))
+
+    def get(self, digest):
+        import pyarrow.feather
+
+        with self.lock:
+            if digest not in self.entries:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(digest)
+            self.hits += 1
+        path = self._path(digest)
+        try:
+            frames = {
+                entry.name[:-len('.feather')]: pyarrow.feather.read_table(entry.path).to_pandas()
+                for entry in os.scandir(path) if entry.name.endswith('.feather')
+            }
+            os.utime(path)
+            return frames
+        except (OSError, pyarrow.ArrowException):
+            with self.lock:
+                self.entries.pop(digest, None)
+                self.hits -= 1
+                self.misses += 1
+            return None
+
+    def put(self, digest, frames):
+        import pyarrow.feather
+
+        if self.max_bytes <= 0:
+            return
+        # Uploads are private to their users, so the cache is only readable by this service's account
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        os.chmod(self.directory, 0o700)
+        tmp_path = f"{self._path(digest)}.{uuid.uuid4().hex}.tmp"
+        try:
+            os.mkdir(tmp_path)
+            for name, frame in frames.items():
+                pyarrow.feather.write_feather(frame, os.path.join(tmp_path, f"{name}.feather"))
+            size = self._size(tmp_path)
+            if size > self.max_bytes:
+                return
+            os.replace(tmp_path, self._path(digest))
+        except (OSError, ValueError, pyarrow.ArrowException):
+            # Another request cached the same file first, or a column Feather cannot store:
+            # a cache write never fails the upload
+            return
+        finally:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+
+        with self.lock:
+            self.entries[digest] = size
+            self.entries.move_to_end(digest)
+            while sum(self.entries.values()) > self.max_bytes:
+                evicted, _ = self.entries.popitem(last=False)
+                self.evictions += 1
+                shutil.rmtree(self._path(evicted), ignore_errors=True)
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "directory": self.directory,
+                "entries": len(self.entries),
+                "bytes": sum(self.entries.values()),
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": self.hits / lookups if lookups else 0.0
+            }
+
+ingest_cache = ParsedDatasetCache(INGEST_CACHE_DIR, INGEST_CACHE_MAX_BYTES)
+
+class DatasetSnapshotStore:
+    # Versioned snapshots of the dataset as uncompressed Feather (Arrow IPC) files, so they can be
+    # memory-mapped. Every worker process reads and writes the same directory: one v{n} directory
+    # per version and a LATEST file naming the newest complete one.
+    def __init__(self, directory, keep):
+        self.directory = directory
+        self.keep = max(keep, 1)
+        self.lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return bool(self.directory)
+
+    def _versions(self):
+        try:
+            names = os.listdir(self.directory) if self.directory else []
+        except OSError:
+            return []
+        return sorted(int(name[1:]) for name in names if name.startswith('v') and name[1:].isdigit())
+
+    def _path(self, version, name=None):
+        version_dir = os.path.join(self.directory, f"v{version}")
+        return os.path.join(version_dir, f"{name}.arrow") if name else version_dir
+
+    def reserve_version(self):
+        # Creating the directory claims the number, so workers never hand out the same version
+        os.makedirs(self.directory, exist_ok=True)
+        versions = self._versions()
+        version = versions[-1] + 1 if versions else 1
+        while True:
+            try:
+                os.mkdir(self._path(version))
+                return version
+            except FileExistsError:
+                version += 1
+
+    def latest(self):
+        try:
+            with open(os.path.join(self.directory, 'LATEST')) as f:
+                return int(f.read().strip())
+        except (OSError, ValueError):
+            return None
+
+    @contextmanager
+    def publishing(self):
+        # Exclusive across the threads of this process and, through flock, across worker processes
+        os.makedirs(self.directory, exist_ok=True)
+        with self.lock, open(os.path.join(self.directory, '.lock'), 'w') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield
+
+    def write(self, version, tables):
+        self.write_files(version, tables)
+        with self.publishing():
+            self.publish(version)
+
+    def write_files(self, version, tables):
+        import pyarrow.feather
+
+        # Readers only open the version named by LATEST, so a crash here never exposes a partial version
+        try:
+            rows = {}
+            for name, table in tables.items():
+                frame = table if isinstance(table, pd.DataFrame) else pd.DataFrame(table)
+                pyarrow.feather.write_feather(frame, self._path(version, name), compression='uncompressed')
+                rows[name] = len(frame)
+            with open(os.path.join(self._path(version), 'manifest.json'), 'w') as f:
+                json.dump({'version': version, 'created_at': datetime.now(UTC).isoformat(), 'rows': rows}, f)
+        except Exception:
+            shutil.rmtree(self._path(version), ignore_errors=True)
+            raise
+
+    def publish(self, version):
+        # Moves LATEST to a written version; the caller holds publishing()
+        # Snapshots can finish out of order; LATEST only moves forward
+        latest = self.latest()
+        if latest is None or version > latest:
+            tmp_path = os.path.join(self.directory, f"LATEST.{uuid.uuid4().hex}.tmp")
+            with open(tmp_path, 'w') as f:
+                f.write(str(version))
+            os.replace(tmp_path, os.path.join(self.directory, 'LATEST'))
+            latest = version
+        # Versions above LATEST may still be being written by another worker. Removing a
+        # version another worker has mapped is safe: its mapping outlives the files.
+        published = [old for old in self._versions() if old <= latest]
+        for old in published[:-self.keep]:
+            shutil.rmtree(self._path(old), ignore_errors=True)
+
+    def open_latest(self):
+        # Maps the files of the newest snapshot; pages are only read once the tables are converted
+        import pyarrow.feather
+
+        version = self.latest()
+        if version is None:
+            return None, None
+        tables = {
+            name: pyarrow.feather.read_table(self._path(version, name), memory_map=True)
+            for name in (*FACT_COLUMNS, *DIMENSION_KEYS)
+        }
+        return version, tables
+
+snapshot_store = DatasetSnapshotStore(SNAPSHOT_DIR, SNAPSHOT_KEEP)
+
+class VersionedResponseCache:
+    # Serialized responses keyed by (dataset version, normalized request), with LRU eviction by size.
+    # Entries of older versions can never be hit again and are dropped once a new version is cached.
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # (version, query) -> (body, content encoding), least recently used first
+        self.bytes = 0
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.lock = threading.Lock()
+
+    def get(self, version, query):
+        with self.lock:
+            entry = self.entries.get((version, query))
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end((version, query))
+            self.hits += 1
+            return entry
+
+    def put(self, version, query, body, encoding=None):
+        if len(body) > self.max_bytes:
+            return
+        with self.lock:
+            if version != self.version:
+                # The dataset changed, so every cached result is stale
+                self.invalidations += len(self.entries)
+                self.entries.clear()
+                self.bytes = 0
+                self.version = version
+            previous = self.entries.pop((version, query), None)
+            if previous is not None:
+                self.bytes -= len(previous[0])
+            self.entries[(version, query)] = (body, encoding)
+            self.bytes += len(body)
+            while self.bytes > self.max_bytes:
+                _, (evicted, _) = self.entries.popitem(last=False)
+                self.bytes -= len(evicted)
+                self.evictions += 1
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "dataset_version": self.version,
+                "entries": len(self.entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "hit_ratio": self.hits / lookups if lookups else 0.0
+            }
+
+metrics_cache = VersionedResponseCache(METRICS_CACHE_MAX_BYTES)
+dataset_bundle_cache = VersionedResponseCache(DATASET_BUNDLE_CACHE_MAX_BYTES)
+# Holds the row ids as the bytes of an int64 array
+facts_order_cache = VersionedResponseCache(FACTS_ORDER_CACHE_MAX_BYTES)
+
+class SingleFlight:
+    # Coalesces identical concurrent computations: the first caller starts the work in the thread
+    # pool and later callers with the same key await that result. Only touched from the event loop.
+    def __init__(self):
+        self.flights = {}  # key -> future of the running computation
+        self.computations = 0
+        self.coalesced = 0
+
+    async def run(self, key, fn, *args):
+        flight = self.flights.get(key)
+        if flight is None:
+            self.computations += 1
+            flight = asyncio.ensure_future(run_in_threadpool(fn, *args))
+            self.flights[key] = flight
+            flight.add_done_callback(lambda _: self.flights.pop(key, None))
+        else:
+            self.coalesced += 1
+        # A caller that disconnects must not cancel the work the others are waiting for
+        return await asyncio.shield(flight)
+
+    def stats(self):
+        return {
+            "in_flight": len(self.flights),
+            "computations": self.computations,
+            "coalesced": self.coalesced
+        }
+
+metrics_flights = SingleFlight()
+dataset_bundle_flights = SingleFlight()
+
+class IngestJobDatabase:
+    """
+    Ingest jobs, kept as one JSON file per job in a directory shared by the
+    workers, so any of them can answer for a job another one runs. The worker
+    running a job keeps it in memory and publishes it on every stage change.
+    Jobs are dropped ttl seconds after their last update.
+    """
+    def __init__(self, directory, ttl):
+        self.directory = directory
+        self.ttl = ttl
+        self.jobs = {}  # job id -> record of a job running on this worker
+        self.paths = {}  # job id -> spooled upload of a job running on this worker
+
+    def _file(self, job_id):
+        return os.path.join(self.directory, f"{job_id}.json")
+
+    def _load(self, job_id):
+        # {'job': ..., 'path': ...} as published, or None once missing or expired
+        path = self._file(job_id)
+        try:
+            if os.path.getmtime(path) < time.time() - self.ttl:
+                os.remove(path)
+                return None
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def add_job(self, job_id, job_data, path):
+        self.expire_jobs()
+        self.jobs[job_id] = job_data
+        self.paths[job_id] = path
+        self.save_job(job_id)
+
+    def save_job(self, job_id):
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        tmp_path = f"{self._file(job_id)}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'job': jsonable_encoder(self.jobs[job_id]), 'path': self.paths[job_id]}, f)
+        os.replace(tmp_path, self._file(job_id))
+
+    def finish_job(self, job_id):
+        # Publishes the final state; from then on every worker reads the job from disk
+        self.save_job(job_id)
+        self.jobs.pop(job_id, None)
+        self.paths.pop(job_id, None)
+
+    def get_job(self, job_id):
+        if job_id in self.jobs:
+            return self.jobs[job_id]
+        stored = self._load(job_id)
+        return stored['job'] if stored else None
+
+    def get_job_path(self, job_id):
+        if job_id in self.paths:
+            return self.paths[job_id]
+        stored = self._load(job_id)
+        return stored['path'] if stored else None
+
+    def job_exists(self, job_id):
+        return self.get_job(job_id) is not None
+
+    def expire_jobs(self):
+        if not os.path.isdir(self.directory):
+            return
+        cutoff = time.time() - self.ttl
+        for entry in os.scandir(self.directory):
+            try:
+                if entry.name.endswith('.json') and entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+            except OSError:
+                pass
+
+ingest_jobs_db = IngestJobDatabase(INGEST_JOB_DIR, INGEST_JOB_TTL_SECONDS)
+
 class SetorDatabase:
     def __init__(self):
         self.setores = {}
@@ -381,6 +1491,517 @@ def safe_str(value):
         return ''
     return str(value)
 
+# Vectorized counterparts of safe_int / safe_float / safe_str, applied to a whole column at once
+def safe_int_series(series):
+    values = pd.to_numeric(series, errors='coerce').astype('float64')
+    values = values.where(np.isfinite(values), 0.0)
+    # astype truncates toward zero, like int(float(value))
+    return values.astype('int64')
+
+def _parse_br_numbers(text):
+    # Handle Brazilian number format: remove dots and replace comma with dot
+    text = text.str.replace('.', '', regex=False).str.replace(',', '.', regex=False)
+    return pd.to_numeric(text, errors='coerce').astype('float64')
+
+def safe_float_series(series):
+    inferred = pd.api.types.infer_dtype(series, skipna=True)
+    if inferred == 'string':
+        values = _parse_br_numbers(series)
+    elif inferred in ('mixed', 'mixed-integer'):
+        is_text = series.map(lambda value: isinstance(value, str))
+        values = _parse_br_numbers(series.where(is_text, None))
+        numbers = pd.to_numeric(series.mask(is_text), errors='coerce').astype('float64')
+        values = values.where(is_text, numbers)
+    else:
+        values = pd.to_numeric(series, errors='coerce').astype('float64')
+    return values.where(np.isfinite(values), 0.0)
+
+def safe_str_series(series):
+    return series.where(series.notna(), '').astype(str)
+
+# Raw "Real x Orçado" ingest
+def prepare_raw_sheet(df):
+    # Set headers from row 1 (index 1), skip first two rows
+    df.columns = [str(column) for column in df.iloc[1]]
+    df = df[2:].reset_index(drop=True)
+
+    # Drop the first column (NaN)
+    return df.iloc[:, 1:]
+
+def _raw_column(df, name, default):
+    if name in df.columns:
+        return df[name]
+    return pd.Series(default, index=df.index, dtype=object)
+
+def build_fact_frames(df, start_index=0):
+    """
+    Builds the fato_orcamento / fato_realizado frames from a prepared raw sheet.
+    Returns (fato_orcamento, fato_realizado, valid_rows); ids are numbered from
+    start_index over the rows with a valid 'Ano', so chunks can be chained.
+    """
+    ano = safe_int_series(_raw_column(df, 'Ano', 0))
+    valid = (ano > 0).to_numpy()
+    df = df[valid]
+    ano = ano[valid]
+    index = pd.Series(np.arange(start_index, start_index + len(df)), index=df.index)
+
+    mes = safe_int_series(_raw_column(df, 'Mês', 0))
+    vlr_orcado = safe_float_series(_raw_column(df, 'Vlr Orçado', 0))
+    valor_dre = safe_float_series(_raw_column(df, 'Valor DRE', 0))
+    codigo_micro_mercado = safe_str_series(_raw_column(df, 'Código Micro Mercado ou UC', ''))
+    codigo_conta = safe_str_series(_raw_column(df, 'Código da Conta Contábil', ''))
+    data = ano.astype(str) + '-' + mes.astype(str).str.zfill(2) + '-01'
+
+    orcamento_rows = (mes > 0) & (vlr_orcado != 0)
+    fato_orcamento = pd.DataFrame({
+        'id': 'orc_' + index[orcamento_rows].astype(str),
+        'ano': ano[orcamento_rows],
+        'mes': mes[orcamento_rows],
+        'data': data[orcamento_rows],
+        'codigoMicroMercado': codigo_micro_mercado[orcamento_rows],
+        'codigoConta': codigo_conta[orcamento_rows],
+        'vlrOrcado': vlr_orcado[orcamento_rows],
+    }).reset_index(drop=True)
+
+    realizado_rows = (mes > 0) & (valor_dre != 0)
+    conta_gerencial = safe_str_series(_raw_column(df, 'Conta Gerencial', ''))[realizado_rows]
+    historico_custo = (
+        safe_str_series(_raw_column(df, 'Departamento', ''))[realizado_rows] + ' - ' +
+        safe_str_series(_raw_column(df, 'Pacote', ''))[realizado_rows] + ' - ' +
+        safe_str_series(_raw_column(df, 'Subpacote', ''))[realizado_rows]
+    )
+    fato_realizado = pd.DataFrame({
+        'id': 'real_' + index[realizado_rows].astype(str),
+        'ano': ano[realizado_rows],
+        'mes': mes[realizado_rows],
+        'data': data[realizado_rows],
+        'codigoMicroMercado': codigo_micro_mercado[realizado_rows],
+        'codigoConta': codigo_conta[realizado_rows],
+        'razaoSocial': conta_gerencial.where(conta_gerencial != '', 'Fornecedor'),
+        'valorCustoTotal': valor_dre[realizado_rows],
+        'historicoCusto': historico_custo,
+    }).reset_index(drop=True)
+
+    return fato_orcamento, fato_realizado, len(df)
+
+def build_dimension_frames(fato_orcamento, fato_realizado):
+    key_columns = ['data', 'ano', 'mes', 'codigoMicroMercado', 'codigoConta']
+    all_facts = pd.concat([fato_orcamento[key_columns], fato_realizado[key_columns]], ignore_index=True)
+
+    d_calendario = all_facts.drop_duplicates('data')[['data', 'ano', 'mes']].reset_index(drop=True)
+    d_calendario['nomeMes'] = [datetime.strptime(data, "%Y-%m-%d").strftime("%B") for data in d_calendario['data']]
+    d_calendario['trimestre'] = (d_calendario['mes'] - 1) // 3 + 1
+
+    micro_mercados = all_facts['codigoMicroMercado']
+    micro_mercados = micro_mercados[micro_mercados != ''].drop_duplicates().reset_index(drop=True)
+    d_estrutura = pd.DataFrame({
+        'codigoMicroMercado': micro_mercados,
+        'nomeMicroMercado': micro_mercados,
+        'nucleo': '',
+        'microNucleo': '',
+        'filial': '',
+        'mercado': ''
+    })
+
+    contas = all_facts['codigoConta']
+    contas = contas[contas != ''].drop_duplicates().reset_index(drop=True)
+    d_conta = pd.DataFrame({
+        'codigoConta': contas,
+        'pacote': '',
+        'subpacote': '',
+        'contaGerencial': '',
+        'contaContabil': contas
+    })
+
+    fornecedores = fato_realizado['razaoSocial']
+    fornecedores = fornecedores[fornecedores != ''].drop_duplicates().reset_index(drop=True)
+    d_fornecedor = pd.DataFrame({
+        'razaoSocial': fornecedores,
+        'tipoFornecedor': 'Fornecedor'
+    })
+
+    return {
+        'd_calendario': d_calendario,
+        'd_estrutura': d_estrutura,
+        'd_conta': d_conta,
+        'd_fornecedor': d_fornecedor
+    }
+
+def build_dataset_frames(df):
+    fato_orcamento, fato_realizado, _ = build_fact_frames(prepare_raw_sheet(df))
+    frames = {'fato_orcamento': fato_orcamento, 'fato_realizado': fato_realizado}
+    frames.update(build_dimension_frames(fato_orcamento, fato_realizado))
+    return frames
+
+# Streaming raw Excel ingest: memory is bounded by the chunk size, not the workbook size
+async def spool_upload(file):
+    # Returns the temp file path and the SHA-256 of the upload
+    digest = hashlib.sha256()
+    spool = tempfile.NamedTemporaryFile(suffix='.xlsx', delete=False)
+    with spool:
+        while chunk := await file.read(UPLOAD_SPOOL_CHUNK_BYTES):
+            digest.update(chunk)
+            spool.write(chunk)
+    return spool.name, digest.hexdigest()
+
+def iter_raw_excel_chunks(path, chunk_rows=RAW_EXCEL_CHUNK_ROWS):
+    # Yields the first sheet as prepared DataFrames of at most chunk_rows rows
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        next(rows, None)
+        header = next(rows, None)
+        if header is None:
+            return
+        # Same headers as prepare_raw_sheet, without the first (NaN) column
+        columns = ['nan' if column is None else str(column) for column in header][1:]
+
+        chunk = []
+        for row in rows:
+            chunk.append(row[1:])
+            if len(chunk) >= chunk_rows:
+                yield pd.DataFrame(chunk, columns=columns, dtype=object)
+                chunk = []
+        if chunk:
+            yield pd.DataFrame(chunk, columns=columns, dtype=object)
+    finally:
+        workbook.close()
+
+def iter_fact_chunks(path, chunk_rows=RAW_EXCEL_CHUNK_ROWS, progress=None):
+    # Yields (fato_orcamento, fato_realizado) per chunk, with ids numbered across the whole sheet.
+    # progress, if given, is called with the number of sheet rows read so far.
+    next_index = 0
+    rows_read = 0
+    for chunk in iter_raw_excel_chunks(path, chunk_rows):
+        fato_orcamento, fato_realizado, valid_rows = build_fact_frames(chunk, next_index)
+        next_index += valid_rows
+        rows_read += len(chunk)
+        if progress:
+            progress(rows_read)
+        yield fato_orcamento, fato_realizado
+
+def _encode_strings(series, vocabulary):
+    # Codes of a string column against a vocabulary grown across the chunks, in order of first appearance
+    codes, uniques = pd.factorize(series)
+    mapping = np.array([vocabulary.setdefault(value, len(vocabulary)) for value in uniques], dtype=np.int32)
+    return mapping[codes]
+
+def build_dataset_frames_streaming(path, chunk_rows=RAW_EXCEL_CHUNK_ROWS, progress=None):
+    """
+    Same frames as build_dataset_frames, parsed chunk by chunk. Each chunk's
+    string columns are kept as int32 codes against one vocabulary per table and
+    column, so the chunks are not held as object columns and concatenated: the
+    peak stays close to the size of the encoded result.
+    """
+    empty = dict(zip(FACT_COLUMNS, build_fact_frames(pd.DataFrame(columns=['Ano']))[:2]))
+    encoded = {table: ['data', *(column for column in CATEGORICAL_COLUMNS if column in empty[table])] for table in empty}
+    vocabularies = {table: {column: {} for column in encoded[table]} for table in empty}
+    chunks = {table: [] for table in empty}
+    for fato_orcamento, fato_realizado in iter_fact_chunks(path, chunk_rows, progress):
+        for table, frame in (('fato_orcamento', fato_orcamento), ('fato_realizado', fato_realizado)):
+            # Copied, since a column's array may be a view that keeps the chunk's whole block alive
+            chunks[table].append({
+                column: _encode_strings(frame[column], vocabularies[table][column]) if column in vocabularies[table]
+                else frame[column].to_numpy(copy=True)
+                for column in frame.columns
+            })
+
+    frames = {}
+    key_facts = {}
+    for table, template in empty.items():
+        columns = {}
+        for column in template.columns:
+            parts = [chunk.pop(column) for chunk in chunks[table]]
+            if not parts:
+                parts = [np.zeros(0, dtype=np.int32) if column in encoded[table] else template[column].to_numpy()]
+            columns[column] = np.concatenate(parts)
+        del chunks[table]
+        categories = {column: np.array(list(vocabulary), dtype=object) for column, vocabulary in vocabularies[table].items()}
+
+        # The first row of each dimension key: the dimensions built from these rows match those built from all
+        first_rows = np.unique(np.concatenate([np.zeros(0, dtype=np.int64)] + [
+            np.unique(columns[column], return_index=True)[1]
+            for column in ('data', 'codigoMicroMercado', 'codigoConta', 'razaoSocial') if column in columns
+        ]))
+        key_facts[table] = pd.DataFrame({
+            column: categories[column].take(values[first_rows]) if column in categories else values[first_rows]
+            for column, values in columns.items() if column != 'id'
+        })
+
+        for column in encoded[table]:
+            codes = columns[column]
+            columns[column] = (
+                pd.Categorical.from_codes(codes, categories=pd.Index(categories[column], dtype=object))
+                if column in CATEGORICAL_COLUMNS else categories[column].take(codes)
+            )
+        frames[table] = pd.DataFrame(columns)
+
+    frames.update(build_dimension_frames(key_facts['fato_orcamento'], key_facts['fato_realizado']))
+    return frames
+
+# Columnar bulk uploads: each table arrives as one array per field and is
+# validated per column against the star schema models, without per-row models
+BULK_TABLES = {
+    'fatoOrcamento': ('fato_orcamento', FatoOrcamento),
+    'fatoRealizado': ('fato_realizado', FatoRealizado),
+    'dCalendario': ('d_calendario', DCalendario),
+    'dEstrutura': ('d_estrutura', DEstrutura),
+    'dConta': ('d_conta', DConta),
+    'dFornecedor': ('d_fornecedor', DFornecedor)
+}
+BULK_DTYPES = {int: 'int64', float: 'float64', str: object}
+
+def validate_bulk_column(series, annotation, label):
+    if len(series) == 0:
+        return series.astype(BULK_DTYPES[annotation])
+    if annotation is str:
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            # Dictionary-encoded Arrow columns, as the table endpoints send them; kept encoded
+            categories = series.cat.categories
+            if series.isna().any() or pd.api.types.infer_dtype(categories, skipna=False) not in ('string', 'empty'):
+                raise ValueError(f"{label}: expected strings")
+            return series
+        if pd.api.types.infer_dtype(series, skipna=False) != 'string':
+            raise ValueError(f"{label}: expected strings")
+        return series.astype(object)
+
+    if pd.api.types.is_bool_dtype(series) or not pd.api.types.is_numeric_dtype(series):
+        raise ValueError(f"{label}: expected numbers")
+    if pd.api.types.is_integer_dtype(series):
+        return series.astype(BULK_DTYPES[annotation])
+    values = series.to_numpy(dtype='float64')
+    if not np.isfinite(values).all():
+        raise ValueError(f"{label}: expected finite numbers")
+    if annotation is int:
+        if not (values == np.trunc(values)).all():
+            raise ValueError(f"{label}: expected integers")
+        return pd.Series(values.astype('int64'))
+    return pd.Series(values)
+
+def columns_to_frame(table, columns):
+    if not isinstance(columns, dict):
+        raise ValueError(f"{table}: expected an object with one array per field")
+    model = BULK_TABLES[table][1]
+    data = {}
+    length = None
+    for field, info in model.model_fields.items():
+        label = f"{table}.{field}"
+        if field not in columns:
+            raise ValueError(f"{label}: missing column")
+        values = columns[field]
+        if not isinstance(values, pd.Series):
+            if not isinstance(values, list):
+                raise ValueError(f"{label}: expected an array")
+            values = pd.Series(values)
+        if length is None:
+            length = len(values)
+        elif len(values) != length:
+            raise ValueError(f"{label}: expected {length} values, got {len(values)}")
+        data[field] = validate_bulk_column(values.reset_index(drop=True), info.annotation, label)
+    return pd.DataFrame(data)
+
+def bulk_payload_to_frames(payload, require_all=True):
+    if not isinstance(payload, dict):
+        raise ValueError("Expected an object keyed by table name")
+    unknown = set(payload) - set(BULK_TABLES)
+    if unknown:
+        raise ValueError(f"Unknown tables: {', '.join(sorted(unknown))}")
+
+    frames = {}
+    for table, (name, model) in BULK_TABLES.items():
+        if table in payload:
+            frames[name] = columns_to_frame(table, payload[table])
+        elif require_all:
+            raise ValueError(f"{table}: missing table")
+        else:
+            frames[name] = columns_to_frame(table, {field: [] for field in model.model_fields})
+    return frames
+
+def _add_ndjson_batch(payload, line):
+    line = line.strip()
+    if not line:
+        return
+    batch = json.loads(line)
+    if not isinstance(batch, dict) or not isinstance(batch.get('table'), str) or not isinstance(batch.get('columns'), dict):
+        raise ValueError('Each NDJSON line must be {"table": "<name>", "columns": {field: [...]}}')
+    table = payload.setdefault(batch['table'], {})
+    for field, values in batch['columns'].items():
+        if not isinstance(values, list):
+            raise ValueError(f"{batch['table']}.{field}: expected an array")
+        table.setdefault(field, []).extend(values)
+
+async def read_ndjson_payload(request):
+    # Streamed NDJSON: one column batch per line, appended to the table's columns as it arrives
+    payload = {}
+    pending = b''
+    async for chunk in request.stream():
+        *lines, pending = (pending + chunk).split(b'\n')
+        for line in lines:
+            _add_ndjson_batch(payload, line)
+    _add_ndjson_batch(payload, pending)
+    return payload
+
+def read_arrow_payload(body):
+    # Concatenated Arrow IPC streams, one per table, named by the "table" key of the schema metadata
+    import pyarrow as pa
+    import pyarrow.ipc
+
+    payload = {}
+    reader = pa.BufferReader(body)
+    while reader.tell() < reader.size():
+        arrow_table = pyarrow.ipc.open_stream(reader).read_all()
+        table = (arrow_table.schema.metadata or {}).get(b'table', b'').decode()
+        if not table:
+            raise ValueError("Each Arrow IPC stream needs a 'table' entry in its schema metadata")
+        frame = arrow_table.to_pandas()
+        payload[table] = {column: frame[column] for column in frame.columns}
+    return payload
+
+# Background ingest jobs. Parsing runs in a worker process, which reports its
+# progress through a small JSON file next to the spooled upload.
+def _write_job_progress(path, progress):
+    tmp_path = f"{path}.progress.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(progress, f)
+    os.replace(tmp_path, f"{path}.progress")
+
+def read_job_progress(path):
+    try:
+        with open(f"{path}.progress") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def parse_raw_excel_job(path, chunk_rows=RAW_EXCEL_CHUNK_ROWS):
+    # Runs in the ingest process pool; returns the dataset frames and per-stage timings
+    started = time.perf_counter()
+    _write_job_progress(path, {'stage': 'parsing', 'rows_processed': 0})
+    frames = build_dataset_frames_streaming(
+        path, chunk_rows,
+        progress=lambda rows: _write_job_progress(path, {'stage': 'parsing', 'rows_processed': rows})
+    )
+    return frames, {'parse_seconds': time.perf_counter() - started}
+
+_ingest_pool = None
+_ingest_tasks = set()
+
+def get_ingest_pool():
+    global _ingest_pool
+    if _ingest_pool is None:
+        _ingest_pool = ProcessPoolExecutor(max_workers=INGEST_WORKERS)
+    return _ingest_pool
+
+_activation_tasks = set()
+
+def build_derived(dataset):
+    try:
+        dataset.build_derived()
+    except Exception as e:
+        print(f"Error indexing dataset version {dataset.id}: {str(e)}")
+
+def sync_latest_snapshot():
+    # Maps the newest snapshot published by any worker (or a previous run) if it is newer than the active tables
+    version = snapshot_store.latest()
+    active = excel_data_db.current.snapshot_version
+    if version is None or (active is not None and version <= active):
+        return None
+    version, tables = snapshot_store.open_latest()
+    return version if excel_data_db.load_snapshot(tables, version) else None
+
+def swap_in_frames(frames, incremental, version=None):
+    if incremental:
+        return excel_data_db.merge_frames(frames, version)
+    return excel_data_db.save_frames(frames, version), None
+
+def publish_frames(frames, incremental=False):
+    """
+    Swaps newly ingested frames in and publishes them as the next snapshot
+    version, which the other workers pick up. The snapshot lock is held from
+    reading the base version to moving LATEST, so ingests on different workers
+    apply one after the other and an incremental one always merges into the
+    newest published version. Returns the dataset and the replaced partitions.
+    """
+    if not snapshot_store.enabled:
+        return swap_in_frames(frames, incremental)
+    with snapshot_store.publishing():
+        if incremental:
+            # Merge into the newest published version, not this worker's possibly older copy
+            sync_latest_snapshot()
+        version = snapshot_store.reserve_version()
+        dataset, replaced = swap_in_frames(frames, incremental, version)
+        try:
+            snapshot_store.write_files(version, dataset.snapshot_frames())
+            snapshot_store.publish(version)
+        except Exception as e:
+            # This worker still serves the version; the others keep the previous one
+            print(f"Error writing dataset snapshot v{version}: {str(e)}")
+    return dataset, replaced
+
+async def activate_frames(frames, incremental=False):
+    # Returns the replaced partitions of an incremental ingest
+    dataset, replaced = await run_in_threadpool(publish_frames, frames, incremental)
+    # The version is immutable, so its indexes and cubes are built in the background
+    task = asyncio.create_task(run_in_threadpool(build_derived, dataset))
+    _activation_tasks.add(task)
+    task.add_done_callback(_activation_tasks.discard)
+    return replaced
+
+async def watch_snapshots(load_now=False):
+    # Picks up the versions published by other workers
+    while True:
+        if not load_now:
+            await asyncio.sleep(SNAPSHOT_POLL_SECONDS)
+        load_now = False
+        try:
+            if await run_in_threadpool(sync_latest_snapshot) is not None:
+                await run_in_threadpool(build_derived, excel_data_db.current)
+        except Exception as e:
+            print(f"Error loading dataset snapshot: {str(e)}")
+
+def format_partitions(partitions):
+    return [f"{ano}-{mes:02d}" for ano, mes in partitions]
+
+async def run_ingest_job(job_id, path, digest, incremental=False):
+    job = ingest_jobs_db.get_job(job_id)
+    loop = asyncio.get_running_loop()
+    try:
+        job['started_at'] = datetime.now(UTC)
+        frames = await run_in_threadpool(ingest_cache.get, digest)
+        job['cache_hit'] = frames is not None
+        if frames is None:
+            job['stage'] = 'parsing'
+            ingest_jobs_db.save_job(job_id)
+            frames, timings = await loop.run_in_executor(get_ingest_pool(), parse_raw_excel_job, path, RAW_EXCEL_CHUNK_ROWS)
+            job['timings'].update(timings)
+            await run_in_threadpool(ingest_cache.put, digest, frames)
+
+        # Encode and sort the new facts off the event loop, then swap them in with a single call
+        job['stage'] = 'activating'
+        ingest_jobs_db.save_job(job_id)
+        activate_started = time.perf_counter()
+        frames = await run_in_threadpool(prepare_fact_frames, frames)
+        replaced = await activate_frames(frames, incremental)
+        job['timings']['activate_seconds'] = time.perf_counter() - activate_started
+
+        job['rows_processed'] = read_job_progress(path).get('rows_processed', job['rows_processed'])
+        job['result'] = {
+            'fato_orcamento': len(frames['fato_orcamento']),
+            'fato_realizado': len(frames['fato_realizado'])
+        }
+        if incremental:
+            job['result']['partitions_replaced'] = format_partitions(replaced)
+        job['stage'] = 'completed'
+    except Exception as e:
+        job['stage'] = 'failed'
+        job['error'] = str(e)
+    finally:
+        job['finished_at'] = datetime.now(UTC)
+        job['timings']['total_seconds'] = (job['finished_at'] - job['queued_at']).total_seconds()
+        for leftover in (path, f"{path}.progress"):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+        ingest_jobs_db.finish_job(job_id)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -391,7 +2012,90 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def get_current_user(token: HTTPAuthorizationCredentials = Depends(security)):
+class VerifiedTokenCache:
+    """
+    Users of recently verified access tokens, keyed by the token's digest and
+    kept until the token expires, so repeated requests skip the signature
+    check and the User construction. Bounded by max_entries, least recently
+    used first. Endpoints that change, disable or delete a user drop the
+    entries of their tokens.
+    """
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # digest -> (email, exp, user)
+        self.by_email = {}  # email -> digests of its cached tokens
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def digest(token):
+        return hashlib.sha256(token.encode()).digest()
+
+    def _drop(self, digest):
+        email, _, _ = self.entries.pop(digest)
+        digests = self.by_email.get(email)
+        if digests is not None:
+            digests.discard(digest)
+            if not digests:
+                del self.by_email[email]
+
+    def get(self, digest):
+        with self.lock:
+            entry = self.entries.get(digest)
+            if entry is not None and entry[1] <= time.time():
+                self._drop(digest)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(digest)
+            self.hits += 1
+            return entry[2]
+
+    def put(self, digest, email, exp, user):
+        if self.max_entries <= 0:
+            return
+        with self.lock:
+            if digest in self.entries:
+                self._drop(digest)
+            self.entries[digest] = (email, exp, user)
+            self.by_email.setdefault(email, set()).add(digest)
+            while len(self.entries) > self.max_entries:
+                self._drop(next(iter(self.entries)))
+                self.evictions += 1
+
+    def invalidate_user(self, email):
+        with self.lock:
+            for digest in list(self.by_email.get(email, ())):
+                self._drop(digest)
+                self.invalidations += 1
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'hit_ratio': self.hits / lookups if lookups else 0.0
+            }
+
+token_cache = VerifiedTokenCache(TOKEN_CACHE_MAX_ENTRIES)
+
+async def get_current_user(token: HTTPAuthorizationCredentials = Depends(security)):
+    # Runs on the event loop: a cached token costs one digest and one lookup, and a miss
+    # only adds an HMAC check, cheaper than a hop to the thread pool
+    digest = token_cache.digest(token.credentials)
+    cached = token_cache.get(digest)
+    if cached is not None:
+        return cached
+
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -411,7 +2115,7 @@ def get_current_user(token: HTTPAuthorizationCredentials = Depends(security)):
         raise credentials_exception
 
     user_data = users_db.get_user(email)
-    return User(
+    user = User(
         email=user_data['email'],
         full_name=user_data['full_name'],
         role=user_data['role'],
@@ -421,6 +2125,124 @@ def get_current_user(token: HTTPAuthorizationCredentials = Depends(security)):
         departamento_id=user_data.get('departamento_id'),
         filial_id=user_data.get('filial_id')
     )
+    # Tokens without an expiry are verified every time
+    if isinstance(payload.get("exp"), (int, float)):
+        token_cache.put(digest, email, payload["exp"], user)
+    return user
+
+class AdmissionControl:
+    """
+    Admission control of one endpoint: a token bucket per client caps its
+    request rate and a counter caps the requests in flight. Overload fails
+    fast instead of queueing: 503 while the endpoint is full, 429 while the
+    client is over its rate, both with Retry-After.
+    """
+    def __init__(self, name, rate, burst, max_in_flight, max_clients=10000):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.max_in_flight = max_in_flight
+        self.max_clients = max_clients
+        self.buckets = {}  # client -> (tokens, time.monotonic() of the last update)
+        self.in_flight = 0
+        self.admitted = 0
+        self.rejected_rate = 0
+        self.rejected_busy = 0
+        self.lock = threading.Lock()
+
+    def _tokens(self, client, now):
+        tokens, updated = self.buckets.get(client, (self.burst, now))
+        return min(self.burst, tokens + (now - updated) * self.rate)
+
+    def _prune(self, now):
+        # A bucket that has refilled is the same as a new one
+        for client in [client for client in self.buckets if self._tokens(client, now) >= self.burst]:
+            del self.buckets[client]
+
+    def _busy(self):
+        self.rejected_busy += 1
+        return HTTPException(
+            status_code=503, detail="Server busy, try again shortly",
+            headers={"Retry-After": str(ADMISSION_BUSY_RETRY_SECONDS)}
+        )
+
+    def reject_busy(self):
+        # For work the endpoint queues past its response, such as background ingest jobs
+        with self.lock:
+            raise self._busy()
+
+    def admit(self, client):
+        now = time.monotonic()
+        with self.lock:
+            if self.max_in_flight and self.in_flight >= self.max_in_flight:
+                raise self._busy()
+            if self.rate:
+                if len(self.buckets) >= self.max_clients:
+                    self._prune(now)
+                tokens = self._tokens(client, now)
+                if tokens < 1:
+                    self.buckets[client] = (tokens, now)
+                    self.rejected_rate += 1
+                    raise HTTPException(
+                        status_code=429, detail="Too many requests",
+                        headers={"Retry-After": str(math.ceil((1 - tokens) / self.rate))}
+                    )
+                self.buckets[client] = (tokens - 1, now)
+            self.in_flight += 1
+            self.admitted += 1
+
+    def release(self):
+        with self.lock:
+            self.in_flight -= 1
+
+    def stats(self):
+        now = time.monotonic()
+        with self.lock:
+            tokens = {client: self._tokens(client, now) for client in self.buckets}
+            return {
+                'rate': self.rate,
+                'burst': self.burst,
+                'max_in_flight': self.max_in_flight,
+                'in_flight': self.in_flight,
+                'admitted': self.admitted,
+                'rejected_rate': self.rejected_rate,
+                'rejected_busy': self.rejected_busy,
+                'clients': len(self.buckets),
+                # Clients currently out of tokens, with the seconds until their next request
+                'throttled': {client: (1 - left) / self.rate for client, left in tokens.items() if left < 1}
+            }
+
+admission_controls = {endpoint: AdmissionControl(endpoint, *limits) for endpoint, limits in ADMISSION_LIMITS.items()}
+
+def admit_user(endpoint):
+    # Route dependency admitting a request per authenticated user; the slot is held until the response is sent
+    async def admission(current_user: User = Depends(get_current_user)):
+        control = admission_controls[endpoint]
+        control.admit(current_user.email)
+        try:
+            yield
+        finally:
+            control.release()
+    return Depends(admission)
+
+def client_ip(request):
+    # The address the nearest trusted proxy saw, with TRUSTED_PROXY_HOPS; the peer address otherwise
+    forwarded = request.headers.get('x-forwarded-for')
+    if TRUSTED_PROXY_HOPS and forwarded:
+        addresses = [address.strip() for address in forwarded.split(',')]
+        return addresses[max(len(addresses) - TRUSTED_PROXY_HOPS, 0)]
+    return request.client.host if request.client else "unknown"
+
+def admit_ip(endpoint):
+    # Route dependency admitting a request per client IP, for endpoints without a user
+    async def admission(request: Request):
+        control = admission_controls[endpoint]
+        control.admit(client_ip(request))
+        try:
+            yield
+        finally:
+            control.release()
+    return Depends(admission)
 
 # Routes
 @app.post("/register", response_model=Token)
@@ -430,7 +2252,7 @@ async def register(user: UserCreate):
         raise HTTPException(status_code=400, detail="Email already registered")
 
     # Create user in in-memory database
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await password_hasher.run(get_password_hash, user.password)
     user_data = {
         'email': user.email,
         'full_name': user.full_name,
@@ -452,18 +2274,26 @@ async def register(user: UserCreate):
     )
     return {"access_token": access_token, "token_type": "bearer"}
 
-@app.post("/login", response_model=Token)
+@app.post("/login", response_model=Token, dependencies=[admit_ip('login')])
 async def login(user: UserLogin):
     # Verify user in in-memory database
     user_exists = users_db.user_exists(user.email)
     if not user_exists:
         raise HTTPException(status_code=400, detail="Incorrect email or password")
 
+    if users_db.pending_passwords:
+        # A login that beats the startup task to the deferred hashes
+        await password_hasher.run(users_db.hash_pending_passwords)
     user_data = users_db.get_user(user.email)
-    password_valid = verify_password(user.password, user_data['password'])
+    password_valid = await password_hasher.run(verify_password, user.password, user_data['password'])
     if not password_valid:
         raise HTTPException(status_code=400, detail="Incorrect email or password")
 
+    # Upgrade a hash made with outdated parameters while the password is at hand
+    new_hash = await password_hasher.rehash(user.password, user_data['password'])
+    if new_hash is not None:
+        user_data['password'] = new_hash
+
     # Create JWT token
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
@@ -500,6 +2330,8 @@ async def update_user(user_update: UserCreate, current_user: User = Depends(get_
     # If email changed, remove old entry
     if user_update.email != current_user.email:
         users_db.users.pop(current_user.email, None)
+    token_cache.invalidate_user(current_user.email)
+    token_cache.invalidate_user(user_update.email)
 
     return User(
         email=user_data['email'],
@@ -545,6 +2377,8 @@ async def update_user_admin(email: str, user_update: UserUpdate, current_user: U
     user_data['departamento_id'] = user_update.departamento_id
     user_data['filial_id'] = user_update.filial_id
     users_db.add_user(email, user_data)
+    # Cached tokens would keep serving the former role and status
+    token_cache.invalidate_user(email)
 
     return {"message": "User updated successfully"}
 
@@ -558,8 +2392,9 @@ async def change_user_password(email: str, password_data: ChangePassword, curren
         raise HTTPException(status_code=404, detail="User not found")
 
     user_data = users_db.get_user(email)
-    user_data['password'] = get_password_hash(password_data.new_password)
+    user_data['password'] = await password_hasher.run(get_password_hash, password_data.new_password)
     users_db.add_user(email, user_data)
+    token_cache.invalidate_user(email)
 
     return {"message": "Password changed successfully"}
 
@@ -578,6 +2413,7 @@ async def delete_user(email: str, current_user: User = Depends(get_current_user)
         raise HTTPException(status_code=400, detail="Cannot delete master admin")
 
     del users_db.users[email]
+    token_cache.invalidate_user(email)
     return {"message": "User deleted successfully"}
 
 @app.get("/permissions")
@@ -780,375 +2616,787 @@ async def get_file(name: str, current_user: User = Depends(get_current_user)):
 @app.post("/upload-excel-data")
 async def upload_excel_data(data: ExcelDataUpload, current_user: User = Depends(get_current_user)):
     try:
-        excel_data_db.save_data(data)
+        await activate_frames(upload_to_frames(data))
         return {"message": "Excel data uploaded and saved successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to save Excel data: {str(e)}")
 
-@app.post("/upload-raw-excel")
-async def upload_raw_excel(file: UploadFile = File(...), current_user: User = Depends(get_current_user)):
+@app.post("/upload-excel-data/bulk")
+async def upload_excel_data_bulk(request: Request, incremental: bool = False, current_user: User = Depends(get_current_user)):
+    content_type = request.headers.get('content-type', '').split(';')[0].strip().lower()
     try:
-        # Read the uploaded Excel file
-        contents = await file.read()
-        df = pd.read_excel(io.BytesIO(contents), sheet_name=0, header=None)
-        df = df.astype(str)
+        if content_type == 'application/json':
+            payload = await run_in_threadpool(json.loads, await request.body())
+        elif content_type == 'application/x-ndjson':
+            payload = await read_ndjson_payload(request)
+        elif content_type == 'application/vnd.apache.arrow.stream':
+            payload = await run_in_threadpool(read_arrow_payload, await request.body())
+        else:
+            raise HTTPException(
+                status_code=415,
+                detail="Use application/json, application/x-ndjson or application/vnd.apache.arrow.stream"
+            )
+        frames = await run_in_threadpool(bulk_payload_to_frames, payload, not incremental)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
 
-        # Set headers from row 1 (index 1), skip first two rows
-        df.columns = df.iloc[1]
-        df = df[2:].reset_index(drop=True)
+    try:
+        frames = await run_in_threadpool(prepare_fact_frames, frames)
+        response = {
+            "message": f"Excel data uploaded and saved successfully. Loaded {len(frames['fato_orcamento'])} orçamento and {len(frames['fato_realizado'])} realizado records."
+        }
+        replaced = await activate_frames(frames, incremental)
+        if incremental:
+            response["partitions_replaced"] = format_partitions(replaced)
+        return response
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to save Excel data: {str(e)}")
 
-        # Drop the first column (NaN)
-        df = df.iloc[:, 1:]
+@app.post(
+    "/upload-raw-excel",
+    dependencies=[admit_user('upload-raw-excel')],
+    openapi_extra={"requestBody": {"required": True, "content": {"multipart/form-data": {"schema": {
+        "type": "object", "required": ["file"], "properties": {"file": {"type": "string", "format": "binary"}}
+    }}}}}
+)
+async def upload_raw_excel(
+    request: Request,  # multipart form with the workbook as "file"
+    streaming: bool = False,  # spool to disk and parse in chunks of RAW_EXCEL_CHUNK_ROWS
+    async_job: bool = False,  # return a job id right away and parse in the ingest process pool
+    incremental: bool = False,  # replace only the (ano, mes) partitions present in the file
+    current_user: User = Depends(get_current_user)
+):
+    # The request's admission slot ends with its response, so the jobs it leaves behind have their own cap
+    if async_job and len(_ingest_tasks) >= INGEST_MAX_PENDING_JOBS:
+        admission_controls['upload-raw-excel'].reject_busy()
+    # The form is only read here, once admitted: FastAPI reads a File(...) parameter before solving the
+    # dependencies, so a request turned away would already have uploaded and spooled its whole workbook
+    async with request.form() as form:
+        file = form.get('file')
+        if not isinstance(file, UploadFile):
+            raise HTTPException(status_code=422, detail="Expected the workbook as the multipart field 'file'")
+        return await ingest_raw_excel(file, streaming, async_job, incremental, current_user)
+
+async def ingest_raw_excel(file, streaming, async_job, incremental, current_user):
+    try:
+        if async_job:
+            path, digest = await spool_upload(file)
+            job_id = uuid.uuid4().hex
+            ingest_jobs_db.add_job(job_id, {
+                'id': job_id,
+                'stage': 'queued',
+                'filename': file.filename,
+                'submitted_by': current_user.email,
+                'rows_processed': 0,
+                'cache_hit': None,
+                'queued_at': datetime.now(UTC),
+                'started_at': None,
+                'finished_at': None,
+                'timings': {},
+                'result': None,
+                'error': None
+            }, path)
+            task = asyncio.create_task(run_ingest_job(job_id, path, digest, incremental))
+            _ingest_tasks.add(task)
+            task.add_done_callback(_ingest_tasks.discard)
+            return {"message": "Raw Excel accepted for processing", "job_id": job_id}
+
+        if streaming:
+            path, digest = await spool_upload(file)
+            try:
+                # Off the event loop: the chunks of a large workbook would stall every other request
+                frames = await run_in_threadpool(ingest_cache.get, digest)
+                cache_hit = frames is not None
+                if frames is None:
+                    frames = await run_in_threadpool(build_dataset_frames_streaming, path)
+                    await run_in_threadpool(ingest_cache.put, digest, frames)
+            finally:
+                os.remove(path)
+        else:
+            # Read the uploaded Excel file
+            contents = await file.read()
+            digest = hashlib.sha256(contents).hexdigest()
+            # The cache reads and writes Feather files, so it is used off the event loop
+            frames = await run_in_threadpool(ingest_cache.get, digest)
+            cache_hit = frames is not None
+            if frames is None:
+                df = pd.read_excel(io.BytesIO(contents), sheet_name=0, header=None)
+
+                # Parse every column once instead of walking the rows
+                frames = build_dataset_frames(df)
+                await run_in_threadpool(ingest_cache.put, digest, frames)
+
+        response = {
+            "message": f"Raw Excel processed and saved successfully. Processed {len(frames['fato_orcamento'])} orçamento and {len(frames['fato_realizado'])} realizado records.",
+            "cached": cache_hit
+        }
+        replaced = await activate_frames(frames, incremental)
+        if incremental:
+            response["partitions_replaced"] = format_partitions(replaced)
+
+        return response
 
-        # Convert to list of dicts for easier processing
-        records = df.to_dict('records')
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to process raw Excel: {str(e)}")
 
-        # Filter out invalid rows where 'Ano' is not numeric
-        records = [r for r in records if safe_int(r.get('Ano', 0)) > 0]
+@app.get("/ingest-jobs/{job_id}")
+async def get_ingest_job(job_id: str, current_user: User = Depends(get_current_user)):
+    job = ingest_jobs_db.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Ingest job not found")
+    if current_user.role != "admin" and job['submitted_by'] != current_user.email:
+        raise HTTPException(status_code=403, detail="Not enough permissions")
 
-        fato_orcamento_data = []
-        fato_realizado_data = []
+    if job['stage'] == 'parsing':
+        job['rows_processed'] = read_job_progress(ingest_jobs_db.get_job_path(job_id)).get('rows_processed', job['rows_processed'])
+    return job
 
-        for index, record in enumerate(records):
-            try:
-                # Extract values with safe parsing
-                ano = safe_int(record.get('Ano', 0))
-                mes = safe_int(record.get('Mês', 0))
-
-                mercado = str(record.get('Mercado', '')) if pd.notna(record.get('Mercado', '')) else ''
-                nucleo = str(record.get('Núcleo', '')) if pd.notna(record.get('Núcleo', '')) else ''
-                microNucleo = str(record.get('Micro Núcleo', '')) if pd.notna(record.get('Micro Núcleo', '')) else ''
-                departamento = str(record.get('Departamento', '')) if pd.notna(record.get('Departamento', '')) else ''
-                filial = str(record.get('Filial', '')) if pd.notna(record.get('Filial', '')) else ''
-                codigoMicroMercado = str(record.get('Código Micro Mercado ou UC', '')) if pd.notna(record.get('Código Micro Mercado ou UC', '')) else ''
-                microMercadoUC = str(record.get('Micro Mercado ou UC', '')) if pd.notna(record.get('Micro Mercado ou UC', '')) else ''
-                custosFPO = safe_float(record.get('Custos FPO (novo)', 0))
-                custosFPMSVO = safe_float(record.get('Custos FPMSVO', 0))
-                custosFPMSVOExecutivo = safe_float(record.get('Custos FPMSVO Executivo', 0))
-                codigoContaGerencial = str(record.get('Código Conta Gerencial', '')) if pd.notna(record.get('Código Conta Gerencial', '')) else ''
-                contaGerencial = str(record.get('Conta Gerencial', '')) if pd.notna(record.get('Conta Gerencial', '')) else ''
-                codigoContaContabil = str(record.get('Código da Conta Contábil', '')) if pd.notna(record.get('Código da Conta Contábil', '')) else ''
-                contaContabil = str(record.get('Conta Contabil', '')) if pd.notna(record.get('Conta Contabil', '')) else ''
-                va = safe_float(record.get('VA', 0))
-                vlrOrcado = safe_float(record.get('Vlr Orçado', 0))
-                valorDRE = safe_float(record.get('Valor DRE', 0))
-                pacote = str(record.get('Pacote', '')) if pd.notna(record.get('Pacote', '')) else ''
-                subpacote = str(record.get('Subpacote', '')) if pd.notna(record.get('Subpacote', '')) else ''
-
-                if ano > 0 and mes > 0:
-                    data_str = f"{ano}-{mes:02d}-01"
-
-                    # Process orçamento data (Vlr Orçado)
-                    if vlrOrcado != 0:
-                        fato_orcamento_data.append(FatoOrcamento(
-                            id=f"orc_{index}",
-                            ano=ano,
-                            mes=mes,
-                            data=data_str,
-                            codigoMicroMercado=codigoMicroMercado,
-                            codigoConta=codigoContaContabil,
-                            vlrOrcado=vlrOrcado
-                        ))
-
-                    # Process realizado data (Valor DRE)
-                    if valorDRE != 0:
-                        fato_realizado_data.append(FatoRealizado(
-                            id=f"real_{index}",
-                            ano=ano,
-                            mes=mes,
-                            data=data_str,
-                            codigoMicroMercado=codigoMicroMercado,
-                            codigoConta=codigoContaContabil,
-                            razaoSocial=contaGerencial or 'Fornecedor',
-                            valorCustoTotal=valorDRE,
-                            historicoCusto=f"{departamento} - {pacote} - {subpacote}"
-                        ))
-            except Exception as e:
-                # Skip invalid records
-                continue
-
-        # Create dimension tables
-        calendario_map = {}
-        estrutura_map = {}
-        conta_map = {}
-        fornecedor_map = {}
-
-        all_facts = fato_orcamento_data + fato_realizado_data
-
-        for fact in all_facts:
-            # DCalendario
-            if fact.data not in calendario_map:
-                date_obj = datetime.strptime(fact.data, "%Y-%m-%d")
-                nome_mes = date_obj.strftime("%B")
-                trimestre = ((fact.mes - 1) // 3) + 1
-                calendario_map[fact.data] = DCalendario(
-                    data=fact.data,
-                    ano=fact.ano,
-                    mes=fact.mes,
-                    nomeMes=nome_mes,
-                    trimestre=trimestre
-                )
-
-            # DEstrutura
-            if fact.codigoMicroMercado and fact.codigoMicroMercado not in estrutura_map:
-                estrutura_map[fact.codigoMicroMercado] = DEstrutura(
-                    codigoMicroMercado=fact.codigoMicroMercado,
-                    nomeMicroMercado=fact.codigoMicroMercado,
-                    nucleo='',
-                    microNucleo='',
-                    filial='',
-                    mercado=''
-                )
-
-            # DConta
-            if fact.codigoConta and fact.codigoConta not in conta_map:
-                conta_map[fact.codigoConta] = DConta(
-                    codigoConta=fact.codigoConta,
-                    pacote='',
-                    subpacote='',
-                    contaGerencial='',
-                    contaContabil=fact.codigoConta
-                )
-
-        # DFornecedor from FatoRealizado
-        for fact in fato_realizado_data:
-            if fact.razaoSocial and fact.razaoSocial not in fornecedor_map:
-                fornecedor_map[fact.razaoSocial] = DFornecedor(
-                    razaoSocial=fact.razaoSocial,
-                    tipoFornecedor='Fornecedor'
-                )
-
-        # Create ExcelDataUpload object and save
-        excel_data = ExcelDataUpload(
-            fatoOrcamento=fato_orcamento_data,
-            fatoRealizado=fato_realizado_data,
-            dCalendario=list(calendario_map.values()),
-            dEstrutura=list(estrutura_map.values()),
-            dConta=list(conta_map.values()),
-            dFornecedor=list(fornecedor_map.values())
-        )
+@app.get("/ingest-cache-stats")
+async def get_ingest_cache_stats(current_user: User = Depends(get_current_user)):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+    return ingest_cache.stats()
 
-        excel_data_db.save_data(excel_data)
+@app.get("/token-cache-stats")
+async def get_token_cache_stats(current_user: User = Depends(get_current_user)):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+    return token_cache.stats()
 
-        return {"message": f"Raw Excel processed and saved successfully. Processed {len(fato_orcamento_data)} orçamento and {len(fato_realizado_data)} realizado records."}
+@app.get("/admission-stats")
+async def get_admission_stats(current_user: User = Depends(get_current_user)):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+    stats = {endpoint: control.stats() for endpoint, control in admission_controls.items()}
+    stats['upload-raw-excel'].update(pending_jobs=len(_ingest_tasks), max_pending_jobs=INGEST_MAX_PENDING_JOBS)
+    return stats
 
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to process raw Excel: {str(e)}")
+@app.get("/password-hash-stats")
+async def get_password_hash_stats(current_user: User = Depends(get_current_user)):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+    return password_hasher.stats()
+
+def representation_etag(dataset, *variant):
+    # Strong validator of one representation of the version: it is fully determined by the version
+    # and the variant (format, content coding and, for /dataset, the tables)
+    digest = hashlib.sha256(repr(variant).encode()).hexdigest()[:12]
+    return f'"dataset-{dataset.id}-{digest}"'
+
+def dataset_headers(dataset, media_type, encoding):
+    # Caches and clients can key on the version id
+    return {"X-Dataset-Version": dataset.id, "ETag": representation_etag(dataset, media_type, encoding)}
+
+# Wire formats of the table endpoints and /metrics, picked from the Accept header. JSON keeps the
+# row objects; the other formats send one array per column instead of repeating the keys per row.
+JSON_MEDIA_TYPE = "application/json"
+COLUMNS_MEDIA_TYPE = "application/vnd.columns+json"
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+MEDIA_TYPE_ALIASES = {"application/x-msgpack": MSGPACK_MEDIA_TYPE}
+TABLE_MEDIA_TYPES = [JSON_MEDIA_TYPE, COLUMNS_MEDIA_TYPE, MSGPACK_MEDIA_TYPE, ARROW_MEDIA_TYPE]
+# Nested documents (/metrics, /dataset) have no Arrow form
+DOCUMENT_MEDIA_TYPES = [JSON_MEDIA_TYPE, COLUMNS_MEDIA_TYPE, MSGPACK_MEDIA_TYPE]
+METRICS_TABLES = ['temporal_data', 'top_suppliers', 'dre_data']
+DIMENSION_MODELS = {name: model for name, model in BULK_TABLES.values() if name in DIMENSION_KEYS}
+
+def parse_accept(header):
+    # [(value, q)] of an Accept or Accept-Encoding header, in header order
+    entries = []
+    for part in (header or '').split(','):
+        value, *params = [item.strip() for item in part.split(';')]
+        q = 1.0
+        for param in params:
+            name, _, number = param.partition('=')
+            if name.strip() == 'q':
+                try:
+                    q = float(number)
+                except ValueError:
+                    q = 0.0
+        if value:
+            entries.append((value.lower(), q))
+    return entries
+
+def negotiate_media_type(accept, offered):
+    # The offered media type with the highest q (header order breaks ties); the first offered
+    # one when the header is absent or only has wildcards
+    if not accept:
+        return offered[0]
+    best, best_q = None, 0.0
+    for value, q in parse_accept(accept):
+        value = MEDIA_TYPE_ALIASES.get(value, value)
+        if value in ('*/*', 'application/*'):
+            candidate = offered[0]
+        elif value in offered:
+            candidate = value
+        else:
+            continue
+        if q > best_q:
+            best, best_q = candidate, q
+    if best is None:
+        raise HTTPException(status_code=406, detail=f"Supported media types: {', '.join(offered)}")
+    return best
+
+def negotiate_encoding(accept_encoding):
+    accepted = dict(parse_accept(accept_encoding))
+    for encoding in ('br', 'gzip'):
+        if encoding == 'br' and brotli is None:
+            continue
+        if accepted.get(encoding, accepted.get('*', 0)) > 0:
+            return encoding
+    return None
+
+def compress_body(body, encoding):
+    # (body, content encoding); small bodies are not worth the CPU
+    if not encoding or len(body) < RESPONSE_COMPRESS_MIN_BYTES:
+        return body, None
+    if encoding == 'br':
+        return brotli.compress(body, quality=RESPONSE_BROTLI_QUALITY), encoding
+    return gzip.compress(body, compresslevel=RESPONSE_GZIP_LEVEL, mtime=0), encoding
+
+def native_value(value):
+    # numpy scalars, for the encoders that do not take them directly
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+def render_json(content):
+    return orjson.dumps(content, default=native_value, option=orjson.OPT_SERIALIZE_NUMPY)
+
+def records_to_columns(records):
+    return {key: [record[key] for record in records] for key in records[0]} if records else {}
+
+def frame_to_arrow(frame, meta):
+    import pyarrow as pa
+    table = pa.Table.from_pandas(frame, preserve_index=False)
+    metadata = {**(table.schema.metadata or {}), **{key: str(value) for key, value in meta.items() if value is not None}}
+    table = table.replace_schema_metadata(metadata)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+def table_data(media_type, frame, records=None):
+    # A table as row objects for JSON and one array per column otherwise; records are the frame's
+    # rows as dicts, when the caller already has them
+    if media_type == JSON_MEDIA_TYPE:
+        return frame_to_records(frame) if records is None else records
+    if media_type == COLUMNS_MEDIA_TYPE:
+        # Numeric columns go to orjson as arrays, without a Python object per value
+        return {column: values.to_numpy() if values.dtype.kind in 'biuf' else values.tolist() for column, values in frame.items()}
+    return {column: values.tolist() for column, values in frame.items()}
+
+def encode_document(media_type, content):
+    if media_type == MSGPACK_MEDIA_TYPE:
+        return msgpack.packb(content, default=native_value)
+    return render_json(content)
+
+def encode_table(media_type, frame, meta, records=None):
+    """
+    {"data": frame, **meta} in the negotiated format; Arrow IPC streams
+    carry meta in the schema metadata instead.
+    """
+    if media_type == ARROW_MEDIA_TYPE:
+        return frame_to_arrow(frame, meta)
+    return encode_document(media_type, {"data": table_data(media_type, frame, records), **meta})
+
+def dataset_table(dataset, table):
+    # (frame, records) of a table; the dimensions are kept as records
+    if table in FACT_COLUMNS:
+        return getattr(dataset, table), None
+    records = getattr(dataset, table)
+    return pd.DataFrame(records, columns=list(DIMENSION_MODELS[table].model_fields)), records
+
+def render_table(dataset, table, media_type, encoding):
+    frame, records = dataset_table(dataset, table)
+    return compress_body(encode_table(media_type, frame, {"dataset_version": dataset.id}, records), encoding)
+
+def wire_response(body, media_type, encoding, dataset, headers=None):
+    headers = {**dataset_headers(dataset, media_type, encoding), "Vary": "Accept, Accept-Encoding", **(headers or {})}
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type=media_type, headers=headers)
+
+async def table_response(request, table):
+    # A whole table of the active version, encoded off the event loop
+    media_type = negotiate_media_type(request.headers.get('accept'), TABLE_MEDIA_TYPES)
+    encoding = negotiate_encoding(request.headers.get('accept-encoding'))
+    dataset = excel_data_db.current
+    body, encoding = await run_in_threadpool(render_table, dataset, table, media_type, encoding)
+    return wire_response(body, media_type, encoding, dataset)
+
+@app.get("/dataset-cache-stats")
+async def get_dataset_cache_stats(current_user: User = Depends(get_current_user)):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+    return {**dataset_bundle_cache.stats(), "single_flight": dataset_bundle_flights.stats()}
+
+@app.get("/metrics-cache-stats")
+async def get_metrics_cache_stats(current_user: User = Depends(get_current_user)):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+    return {**metrics_cache.stats(), "single_flight": metrics_flights.stats()}
+
+@app.get("/facts-cache-stats")
+async def get_facts_cache_stats(current_user: User = Depends(get_current_user)):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+    return facts_order_cache.stats()
 
 @app.get("/get-fato-orcamento")
-async def get_fato_orcamento(current_user: User = Depends(get_current_user)):
-    return {"data": excel_data_db.get_fato_orcamento()}
+async def get_fato_orcamento(request: Request, current_user: User = Depends(get_current_user)):
+    return await table_response(request, 'fato_orcamento')
 
 @app.get("/get-fato-realizado")
-async def get_fato_realizado(current_user: User = Depends(get_current_user)):
-    return {"data": excel_data_db.get_fato_realizado()}
+async def get_fato_realizado(request: Request, current_user: User = Depends(get_current_user)):
+    return await table_response(request, 'fato_realizado')
 
 @app.get("/get-d-calendario")
-async def get_d_calendario(current_user: User = Depends(get_current_user)):
-    return {"data": excel_data_db.get_d_calendario()}
+async def get_d_calendario(request: Request, current_user: User = Depends(get_current_user)):
+    return await table_response(request, 'd_calendario')
 
 @app.get("/get-d-estrutura")
-async def get_d_estrutura(current_user: User = Depends(get_current_user)):
-    return {"data": excel_data_db.get_d_estrutura()}
+async def get_d_estrutura(request: Request, current_user: User = Depends(get_current_user)):
+    return await table_response(request, 'd_estrutura')
 
 @app.get("/get-d-conta")
-async def get_d_conta(current_user: User = Depends(get_current_user)):
-    return {"data": excel_data_db.get_d_conta()}
+async def get_d_conta(request: Request, current_user: User = Depends(get_current_user)):
+    return await table_response(request, 'd_conta')
 
 @app.get("/get-d-fornecedor")
-async def get_d_fornecedor(current_user: User = Depends(get_current_user)):
-    return {"data": excel_data_db.get_d_fornecedor()}
+async def get_d_fornecedor(request: Request, current_user: User = Depends(get_current_user)):
+    return await table_response(request, 'd_fornecedor')
+
+DATASET_TABLES = [*FACT_COLUMNS, *DIMENSION_KEYS]
+
+def bundle_etag(dataset, tables, media_type, encoding):
+    return representation_etag(dataset, tables, media_type, encoding)
+
+def etag_matches(if_none_match, etag):
+    # Weak comparison, as If-None-Match uses
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(',')]
+    return '*' in tags or etag in (tag[2:] if tag.startswith('W/') else tag for tag in tags)
+
+def render_dataset_bundle(dataset, tables, media_type, encoding):
+    data = {}
+    for table in tables:
+        frame, records = dataset_table(dataset, table)
+        data[table] = table_data(media_type, frame, records)
+    body, encoding_used = compress_body(encode_document(media_type, {"data": data, "dataset_version": dataset.id}), encoding)
+    if dataset is excel_data_db.current:
+        dataset_bundle_cache.put(dataset.id, (tables, media_type, encoding), body, encoding_used)
+    return body, encoding_used
+
+@app.get("/dataset")
+async def get_dataset(
+    request: Request,
+    tables: Optional[str] = None,  # comma-separated, all six by default
+    current_user: User = Depends(get_current_user)
+):
+    """
+    The selected tables of the active dataset version in one response, as
+    {"data": {table: rows}, "dataset_version": ...}. Send the ETag back in
+    If-None-Match to get a 304 while the version has not changed.
+    """
+    selected = split_values(tables) or DATASET_TABLES
+    unknown = [table for table in selected if table not in DATASET_TABLES]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown tables: {', '.join(unknown)}")
+    selected = tuple(table for table in DATASET_TABLES if table in selected)
+    media_type = negotiate_media_type(request.headers.get('accept'), DOCUMENT_MEDIA_TYPES)
+    encoding = negotiate_encoding(request.headers.get('accept-encoding'))
+
+    dataset = excel_data_db.current
+    # Private data, but the client may keep it as long as it revalidates
+    headers = {"ETag": bundle_etag(dataset, selected, media_type, encoding), "Cache-Control": "private, no-cache"}
+    if etag_matches(request.headers.get('if-none-match'), headers["ETag"]):
+        return Response(status_code=304, headers={**dataset_headers(dataset, media_type, encoding), "Vary": "Accept, Accept-Encoding", **headers})
+
+    entry = dataset_bundle_cache.get(dataset.id, (selected, media_type, encoding))
+    if entry is None:
+        entry = await dataset_bundle_flights.run(
+            (dataset.id, selected, media_type, encoding), render_dataset_bundle, dataset, selected, media_type, encoding
+        )
+    body, encoding = entry
+    return wire_response(body, media_type, encoding, dataset, headers)
+
+def split_values(text):
+    # A comma-separated filter as a sorted tuple of distinct values (None when absent)
+    return tuple(sorted({value.strip() for value in text.split(',')})) if text else None
+
+def fact_filters(table, suppliers, accounts, markets):
+    # Dimension filters of a fact table; fato_orcamento has no supplier
+    filters = {}
+    if suppliers and 'razaoSocial' in FACT_COLUMNS[table]:
+        filters['razaoSocial'] = list(suppliers)
+    if accounts:
+        filters['codigoConta'] = list(accounts)
+    if markets:
+        filters['codigoMicroMercado'] = list(markets)
+    return filters
+
+def encode_cursor(dataset, query, offset):
+    digest = hashlib.sha256(repr(query).encode()).hexdigest()[:16]
+    token = json.dumps({"v": dataset.id, "q": digest, "o": offset}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(token.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor, dataset, query):
+    # Offset of the next page; a cursor only continues the query and dataset version it came from
+    try:
+        token = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        version, digest, offset = token["v"], token["q"], int(token["o"])
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if digest != hashlib.sha256(repr(query).encode()).hexdigest()[:16] or offset < 0:
+        raise HTTPException(status_code=400, detail="Cursor does not belong to this query")
+    if version != dataset.id:
+        raise HTTPException(status_code=410, detail="Dataset changed since the first page; restart the query without a cursor")
+    return offset
+
+def order_rows(frame, rows, sort):
+    # Row ids in the requested order ([(column, descending)]); ties keep the table order
+    selection = {}
+    for column, _ in sort:
+        values = frame[column] if rows is None else frame[column].take(rows)
+        # Categories are not necessarily in value order, so they are compared as values
+        selection[column] = values.astype(object) if isinstance(values.dtype, pd.CategoricalDtype) else values
+    ordered = pd.DataFrame(selection).sort_values(
+        [column for column, _ in sort], ascending=[not descending for _, descending in sort],
+        kind='stable', na_position='last'
+    )
+    return ordered.index.to_numpy()
+
+def query_rows(dataset, table, query):
+    # Row ids of a query in page order (None for the whole table in table order). Filtered or
+    # sorted ids are cached per version, so a cursor does not filter and sort the table again.
+    entry = facts_order_cache.get(dataset.id, (table, query))
+    if entry is not None:
+        return np.frombuffer(entry[0], dtype=np.int64)
+
+    start_date, end_date, suppliers, accounts, markets, sort = query
+    date_range = (start_date, end_date) if start_date or end_date else None
+    rows = dataset.select_rows(table, date_range, fact_filters(table, suppliers, accounts, markets))
+    if sort:
+        rows = order_rows(getattr(dataset, table), rows, sort)
+    # A date block without filters is a range, which is already sliced for free
+    if rows is not None and not isinstance(rows, pd.RangeIndex):
+        rows = np.asarray(rows, dtype=np.int64)
+        if dataset is excel_data_db.current:
+            facts_order_cache.put(dataset.id, (table, query), rows.tobytes())
+    return rows
+
+def query_fact_page(dataset, table, query, fields, limit, cursor, media_type, encoding):
+    frame = getattr(dataset, table)
+    # Checked first, so a stale or foreign cursor costs no query
+    offset = decode_cursor(cursor, dataset, query) if cursor else 0
+    rows = query_rows(dataset, table, query)
+    total = len(frame) if rows is None else len(rows)
+
+    end = min(offset + limit, total)
+    page = np.arange(offset, end) if rows is None else rows[offset:end]
+    meta = {
+        "total": total,
+        "next_cursor": encode_cursor(dataset, query, end) if end < total else None,
+        "dataset_version": dataset.id
+    }
+    return compress_body(encode_table(media_type, frame.take(page)[fields], meta), encoding)
 
-@app.get("/metrics")
-async def get_metrics(
-    # Time filters
-    period: str = "monthly",  # "daily", "monthly", "annual", "custom"
+@app.get("/facts/{table}")
+async def query_facts(
+    table: str,
+    request: Request,
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
-    # Dimension filters
-    suppliers: Optional[str] = None,  # comma-separated
-    accounts: Optional[str] = None,   # comma-separated
-    markets: Optional[str] = None,    # comma-separated
+    suppliers: Optional[str] = None,
+    accounts: Optional[str] = None,
+    markets: Optional[str] = None,
+    fields: Optional[str] = None,  # comma-separated columns to return, all by default
+    sort: Optional[str] = None,  # comma-separated columns, "-" prefix for descending
+    limit: int = FACTS_PAGE_SIZE,
+    cursor: Optional[str] = None,
     current_user: User = Depends(get_current_user)
 ):
     """
-    Endpoint para métricas BI com filtros dinâmicos.
-    Retorna dados agregados para gráficos e KPIs.
+    Filtered page of fato_orcamento or fato_realizado. Pass next_cursor back
+    as cursor to get the following page of the same query and dataset version.
     """
-    try:
-        import pandas as pd
-        from typing import List, Dict, Any
-
-        # Get raw data
-        fato_orcamento = excel_data_db.get_fato_orcamento()
-        fato_realizado = excel_data_db.get_fato_realizado()
-        d_calendario = excel_data_db.get_d_calendario()
-        d_estrutura = excel_data_db.get_d_estrutura()
-        d_conta = excel_data_db.get_d_conta()
-        d_fornecedor = excel_data_db.get_d_fornecedor()
-
-        if not fato_orcamento or not fato_realizado:
-            return {"error": "Dados não carregados. Faça upload do Excel primeiro."}
-
-        # Convert to DataFrames
-        df_orcamento = pd.DataFrame(fato_orcamento)
-        df_realizado = pd.DataFrame(fato_realizado)
-        df_calendario = pd.DataFrame(d_calendario)
-        df_estrutura = pd.DataFrame(d_estrutura)
-        df_conta = pd.DataFrame(d_conta)
-        df_fornecedor = pd.DataFrame(d_fornecedor)
-
-        # Apply filters
-        # Time filters
-        if period == "custom" and start_date and end_date:
-            # Filter by custom date range
-            df_orcamento = df_orcamento[
-                (df_orcamento['data'] >= start_date) & (df_orcamento['data'] <= end_date)
-            ]
-            df_realizado = df_realizado[
-                (df_realizado['data'] >= start_date) & (df_realizado['data'] <= end_date)
-            ]
-        elif period == "annual":
-            # Group by year
-            pass  # Will handle in aggregation
-        elif period == "monthly":
-            # Group by year-month
-            pass  # Will handle in aggregation
-        elif period == "daily":
-            # Group by date
-            pass  # Will handle in aggregation
-
-        # Dimension filters
-        if suppliers:
-            supplier_list = [s.strip() for s in suppliers.split(',')]
-            df_realizado = df_realizado[df_realizado['razaoSocial'].isin(supplier_list)]
-
-        if accounts:
-            account_list = [a.strip() for a in accounts.split(',')]
-            df_orcamento = df_orcamento[df_orcamento['codigoConta'].isin(account_list)]
-            df_realizado = df_realizado[df_realizado['codigoConta'].isin(account_list)]
+    if table not in FACT_COLUMNS:
+        raise HTTPException(status_code=404, detail="Unknown fact table")
+    columns = FACT_COLUMNS[table]
+    selected = [field.strip() for field in fields.split(',')] if fields else columns
+    sort_keys = {}
+    for key in sort.split(',') if sort else []:
+        # The first mention of a column decides its direction
+        sort_keys.setdefault(key.strip().lstrip('-'), key.strip().startswith('-'))
+    sort_keys = list(sort_keys.items())
+    unknown = [column for column in [*selected, *(column for column, _ in sort_keys)] if column not in columns]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown columns: {', '.join(unknown)}")
+    if not 1 <= limit <= FACTS_PAGE_MAX:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {FACTS_PAGE_MAX}")
+
+    media_type = negotiate_media_type(request.headers.get('accept'), TABLE_MEDIA_TYPES)
+    encoding = negotiate_encoding(request.headers.get('accept-encoding'))
+    dataset = excel_data_db.current
+    # Projection and page size do not change the order, so they may vary between pages
+    query = (start_date, end_date, split_values(suppliers), split_values(accounts), split_values(markets), tuple(sort_keys))
+    body, encoding = await run_in_threadpool(
+        query_fact_page, dataset, table, query, list(dict.fromkeys(selected)), limit, cursor, media_type, encoding
+    )
+    return wire_response(body, media_type, encoding, dataset)
 
-        if markets:
-            market_list = [m.strip() for m in markets.split(',')]
-            df_orcamento = df_orcamento[df_orcamento['codigoMicroMercado'].isin(market_list)]
-            df_realizado = df_realizado[df_realizado['codigoMicroMercado'].isin(market_list)]
+def normalize_metrics_query(period, start_date, end_date, suppliers, accounts, markets):
+    # Canonical form of the /metrics filters: the date range only counts for custom periods and the
+    # comma-separated lists are deduplicated and sorted, so equivalent requests share a cache entry
+    if not (period == "custom" and start_date and end_date):
+        start_date = end_date = None
+    return (period, start_date, end_date, split_values(suppliers), split_values(accounts), split_values(markets))
 
-        # Aggregate data based on period
-        if period == "annual":
-            # Annual aggregation
-            temporal_orcado = df_orcamento.groupby('ano')['vlrOrcado'].sum().reset_index()
-            temporal_realizado = df_realizado.groupby('ano')['valorCustoTotal'].sum().reset_index()
-
-            temporal_data = pd.merge(
-                temporal_orcado, temporal_realizado,
-                on='ano', how='outer'
-            ).fillna(0)
-            temporal_data['period'] = temporal_data['ano'].astype(str)
+def compute_metrics(dataset, period, start_date, end_date, suppliers, accounts, markets):
+    """
+    Aggregates behind /metrics for one pinned dataset version and a query
+    from normalize_metrics_query.
+    """
+    import pandas as pd
+    from typing import List, Dict, Any
 
-        elif period == "monthly":
-            # Monthly aggregation
-            df_orcamento['period'] = df_orcamento['ano'].astype(str) + '-' + df_orcamento['mes'].astype(str).str.zfill(2)
-            df_realizado['period'] = df_realizado['ano'].astype(str) + '-' + df_realizado['mes'].astype(str).str.zfill(2)
+    # The fact store is already columnar, so the frames are used as they are (never mutate them)
+    df_orcamento = dataset.fato_orcamento
+    df_realizado = dataset.fato_realizado
 
-            temporal_orcado = df_orcamento.groupby('period')['vlrOrcado'].sum().reset_index()
-            temporal_realizado = df_realizado.groupby('period')['valorCustoTotal'].sum().reset_index()
+    if df_orcamento.empty or df_realizado.empty:
+        return {"error": "Dados não carregados. Faça upload do Excel primeiro.", "dataset_version": dataset.id}
 
-            temporal_data = pd.merge(
-                temporal_orcado, temporal_realizado,
-                on='period', how='outer'
-            ).fillna(0)
+    # Apply filters
+    # Time filters (annual, monthly and daily are handled in the aggregation)
+    date_range = None
+    if start_date and end_date:
+        # Filter by custom date range
+        date_range = (start_date, end_date)
 
+    # Dimension filters
+    orcamento_filters = fact_filters('fato_orcamento', suppliers, accounts, markets)
+    realizado_filters = fact_filters('fato_realizado', suppliers, accounts, markets)
+
+    # Everything below is a sum, so the rollup cubes give the same answer from far fewer rows.
+    # The facts are only read when a filter is not a cube dimension or a cube was not kept.
+    served_from = 'facts'
+    if set(CUBE_DIMENSIONS).issuperset([*orcamento_filters, *realizado_filters]):
+        if all(dataset.cube(table) is not None for table in FACT_COLUMNS):
+            served_from = 'cube'
+
+    # Resolved through the version's indexes, so the cost follows the matching rows
+    df_orcamento = dataset.filter_facts('fato_orcamento', date_range, orcamento_filters, served_from)
+    df_realizado = dataset.filter_facts('fato_realizado', date_range, realizado_filters, served_from)
+
+    def period_codes(table, frame):
+        # Months are grouped by the integer ano * 100 + mes; only the groups are formatted
+        if period == "annual":
+            return encode_key(frame['ano'])
+        if period == "monthly":
+            return encode_key(frame['ano'] * 100 + frame['mes'])
+        return dataset.key_codes(table, 'data', frame, served_from)
+
+    # Every aggregate below comes from one grouped sum per key over integer codes
+    orcamento_keys = {'codigoConta': encode_key(df_orcamento['codigoConta'])}
+    realizado_keys = {
+        'codigoConta': encode_key(df_realizado['codigoConta']),
+        'razaoSocial': encode_key(df_realizado['razaoSocial'])
+    }
+    temporal_key = {"annual": 'ano', "monthly": 'period', "daily": 'data'}.get(period)
+    if temporal_key:
+        orcamento_keys[temporal_key] = period_codes('fato_orcamento', df_orcamento)
+        realizado_keys[temporal_key] = period_codes('fato_realizado', df_realizado)
+    orcamento_sums = aggregate_facts(df_orcamento, 'vlrOrcado', orcamento_keys)
+    realizado_sums = aggregate_facts(df_realizado, 'valorCustoTotal', realizado_keys)
+
+    # Aggregate data based on period
+    if temporal_key:
+        temporal_orcado = orcamento_sums[temporal_key]
+        temporal_realizado = realizado_sums[temporal_key]
+        if period == "monthly":
+            temporal_orcado['period'] = month_labels(temporal_orcado['period'])
+            temporal_realizado['period'] = month_labels(temporal_realizado['period'])
+
+        temporal_data = pd.merge(
+            temporal_orcado, temporal_realizado,
+            on=temporal_key, how='outer'
+        ).fillna(0)
+        if period == "annual":
+            temporal_data['period'] = temporal_data['ano'].astype(str)
         elif period == "daily":
-            # Daily aggregation
-            temporal_orcado = df_orcamento.groupby('data')['vlrOrcado'].sum().reset_index()
-            temporal_realizado = df_realizado.groupby('data')['valorCustoTotal'].sum().reset_index()
-
-            temporal_data = pd.merge(
-                temporal_orcado, temporal_realizado,
-                on='data', how='outer'
-            ).fillna(0)
             temporal_data['period'] = temporal_data['data']
 
-        else:  # custom or default
-            temporal_data = pd.DataFrame()
-
-        # Sort temporal data
-        if not temporal_data.empty:
-            if 'period' in temporal_data.columns:
-                temporal_data = temporal_data.sort_values('period')
-            temporal_data = temporal_data.rename(columns={
-                'vlrOrcado': 'orcado',
-                'valorCustoTotal': 'realizado'
-            })
+    else:  # custom or default
+        temporal_data = pd.DataFrame()
 
-        # Top suppliers
-        top_suppliers = df_realizado.groupby('razaoSocial')['valorCustoTotal'].sum().reset_index()
-        top_suppliers = top_suppliers.sort_values('valorCustoTotal', ascending=False).head(10)
-        top_suppliers = top_suppliers.rename(columns={'valorCustoTotal': 'valor'})
+    # Sort temporal data
+    if not temporal_data.empty:
+        if 'period' in temporal_data.columns:
+            temporal_data = temporal_data.sort_values('period')
+        temporal_data = temporal_data.rename(columns={
+            'vlrOrcado': 'orcado',
+            'valorCustoTotal': 'realizado'
+        })
 
-        # DRE data (by account)
-        dre_orcado = df_orcamento.groupby('codigoConta')['vlrOrcado'].sum().reset_index()
-        dre_realizado = df_realizado.groupby('codigoConta')['valorCustoTotal'].sum().reset_index()
+    # Top suppliers
+    top_suppliers = realizado_sums['razaoSocial']
+    top_suppliers = top_suppliers.sort_values('valorCustoTotal', ascending=False).head(10)
+    top_suppliers = top_suppliers.rename(columns={'valorCustoTotal': 'valor'})
+
+    # DRE data (by account)
+    dre_data = pd.merge(
+        orcamento_sums['codigoConta'], realizado_sums['codigoConta'],
+        on='codigoConta', how='outer'
+    ).fillna(0)
+
+    orcado = dre_data['vlrOrcado'].to_numpy()
+    realizado = dre_data['valorCustoTotal'].to_numpy()
+    budgeted = orcado > 0
+    if budgeted.any():
+        with np.errstate(divide='ignore', invalid='ignore'):
+            dre_data['variacao'] = np.where(budgeted, (realizado - orcado) / orcado * 100, 0.0)
+    else:
+        # Integer zeros, as the former row-wise computation returned when no account had a budget
+        dre_data['variacao'] = np.zeros(len(dre_data), dtype=np.int64 if len(dre_data) else np.float64)
 
-        dre_data = pd.merge(
-            dre_orcado, dre_realizado,
-            on='codigoConta', how='outer'
-        ).fillna(0)
+    dre_data = dre_data.rename(columns={
+        'codigoConta': 'conta',
+        'vlrOrcado': 'orcado',
+        'valorCustoTotal': 'realizado'
+    })
 
-        dre_data['variacao'] = dre_data.apply(
-            lambda row: ((row['valorCustoTotal'] - row['vlrOrcado']) / row['vlrOrcado'] * 100) if row['vlrOrcado'] > 0 else 0,
-            axis=1
-        )
+    # KPIs
+    total_orcado = df_orcamento['vlrOrcado'].sum()
+    total_realizado = df_realizado['valorCustoTotal'].sum()
+    adherence = (total_realizado / total_orcado * 100) if total_orcado > 0 else 0
 
-        dre_data = dre_data.rename(columns={
-            'codigoConta': 'conta',
-            'vlrOrcado': 'orcado',
-            'valorCustoTotal': 'realizado'
-        })
+    # Available filter options (for cascading), from the facet indexes
+    options = facet_options(dataset, period, date_range, suppliers, accounts, markets)
 
-        # KPIs
-        total_orcado = df_orcamento['vlrOrcado'].sum()
-        total_realizado = df_realizado['valorCustoTotal'].sum()
-        adherence = (total_realizado / total_orcado * 100) if total_orcado > 0 else 0
+    return {
+        "temporal_data": temporal_data.to_dict('records') if not temporal_data.empty else [],
+        "top_suppliers": top_suppliers.to_dict('records'),
+        "dre_data": dre_data.to_dict('records'),
+        "kpis": {
+            "total_orcado": total_orcado,
+            "total_realizado": total_realizado,
+            "adherence": adherence,
+            "total_suppliers": len(realizado_sums['razaoSocial']),
+            "total_accounts": len(orcamento_sums['codigoConta']),
+            "total_markets": len(distinct_values(*encode_key(df_orcamento['codigoMicroMercado'])))
+        },
+        "available_filters": {name: values.index.tolist() for name, values in options.items()},
+        "dataset_version": dataset.id,
+        "served_from": served_from
+    }
 
-        # Available filter options (for cascading)
-        available_suppliers = sorted(df_realizado['razaoSocial'].dropna().unique().tolist())
-        available_accounts = sorted(df_orcamento['codigoConta'].dropna().unique().tolist())
-        available_markets = sorted(df_orcamento['codigoMicroMercado'].dropna().unique().tolist())
+def encode_metrics(media_type, content):
+    if media_type != JSON_MEDIA_TYPE:
+        # Columnar JSON and MessagePack turn the record lists into one list per column
+        content = {key: records_to_columns(value) if key in METRICS_TABLES else value for key, value in content.items()}
+    return encode_document(media_type, content)
 
-        # Available periods based on data
-        if period == "annual":
-            available_periods = sorted(df_orcamento['ano'].dropna().unique().astype(str).tolist())
-        elif period == "monthly":
-            periods = (df_orcamento['ano'].astype(str) + '-' + df_orcamento['mes'].astype(str).str.zfill(2)).dropna().unique().tolist()
-            available_periods = sorted(periods)
-        else:
-            available_periods = sorted(df_orcamento['data'].dropna().unique().tolist())
+def render_metrics(dataset, query, media_type, encoding):
+    body, encoding_used = compress_body(encode_metrics(media_type, compute_metrics(dataset, *query)), encoding)
+    if dataset is excel_data_db.current:
+        metrics_cache.put(dataset.id, (query, media_type, encoding), body, encoding_used)
+    return body, encoding_used
 
-        return {
-            "temporal_data": temporal_data.to_dict('records') if not temporal_data.empty else [],
-            "top_suppliers": top_suppliers.to_dict('records'),
-            "dre_data": dre_data.to_dict('records'),
-            "kpis": {
-                "total_orcado": total_orcado,
-                "total_realizado": total_realizado,
-                "adherence": adherence,
-                "total_suppliers": len(available_suppliers),
-                "total_accounts": len(available_accounts),
-                "total_markets": len(available_markets)
-            },
-            "available_filters": {
-                "suppliers": available_suppliers,
-                "accounts": available_accounts,
-                "markets": available_markets,
-                "periods": available_periods
-            }
-        }
+@app.get("/metrics", dependencies=[admit_user('metrics')])
+async def get_metrics(
+    request: Request,
+    # Time filters
+    period: str = "monthly",  # "daily", "monthly", "annual", "custom"
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    # Dimension filters
+    suppliers: Optional[str] = None,  # comma-separated
+    accounts: Optional[str] = None,   # comma-separated
+    markets: Optional[str] = None,    # comma-separated
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Endpoint para métricas BI com filtros dinâmicos.
+    Retorna dados agregados para gráficos e KPIs.
+    """
+    media_type = negotiate_media_type(request.headers.get('accept'), DOCUMENT_MEDIA_TYPES)
+    encoding = negotiate_encoding(request.headers.get('accept-encoding'))
+    try:
+        # One version for the whole computation, even if an ingest publishes a new one meanwhile
+        dataset = excel_data_db.current
+        query = normalize_metrics_query(period, start_date, end_date, suppliers, accounts, markets)
+        entry = metrics_cache.get(dataset.id, (query, media_type, encoding))
+        if entry is None:
+            # Identical requests arriving while this one computes share its result
+            entry = await metrics_flights.run(
+                (dataset.id, query, media_type, encoding), render_metrics, dataset, query, media_type, encoding
+            )
+        body, encoding = entry
+        return wire_response(body, media_type, encoding, dataset)
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao processar métricas: {str(e)}")
 
-@app.post("/chat")
+def facet_options(dataset, period, date_range, suppliers, accounts, markets):
+    """
+    Cascading filter options of a /metrics query: for each dimension, the
+    values found in the facts that match every other filter, with their number
+    of facts in both tables. A table only counts when it has every filtered
+    column, so selected suppliers narrow the options to fato_realizado.
+    """
+    selected = {'razaoSocial': suppliers, 'codigoConta': accounts, 'codigoMicroMercado': markets}
+    keys = [*FACET_DIMENSIONS.items(), ('periods', PERIOD_FACETS.get(period, 'data'))]
+    options = {}
+    for name, key in keys:
+        # A dimension's own selection does not narrow its options
+        filters = {column: list(values) for column, values in selected.items() if values and column != key}
+        key_range = None if name == 'periods' else date_range
+        counts = []
+        for table in FACT_COLUMNS:
+            facets = dataset.facets(table)
+            if key in facets.keys and set(filters).issubset(FACT_COLUMNS[table]):
+                counts.append(facets.options(dataset, key, key_range, filters))
+        options[name] = pd.concat(counts).groupby(level=0).sum() if counts else pd.Series(dtype=np.int64)
+    return options
+
+def render_facets(dataset, query, media_type, encoding):
+    period, start_date, end_date, suppliers, accounts, markets = query
+    date_range = (start_date, end_date) if start_date and end_date else None
+    options = facet_options(dataset, period, date_range, suppliers, accounts, markets)
+    content = {}
+    for name, values in options.items():
+        columns = {"value": values.index.tolist(), "count": values.tolist()}
+        # Records in JSON; the columnar formats keep the columns
+        content[name] = [dict(zip(columns, row)) for row in zip(*columns.values())] if media_type == JSON_MEDIA_TYPE else columns
+    content["dataset_version"] = dataset.id
+    return compress_body(encode_document(media_type, content), encoding)
+
+@app.get("/facets")
+async def get_facets(
+    request: Request,
+    period: str = "monthly",
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    suppliers: Optional[str] = None,
+    accounts: Optional[str] = None,
+    markets: Optional[str] = None,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Filter options for /metrics with the number of facts behind each. Takes the
+    /metrics filters; the options of a dimension follow every filter but its own.
+    """
+    media_type = negotiate_media_type(request.headers.get('accept'), DOCUMENT_MEDIA_TYPES)
+    encoding = negotiate_encoding(request.headers.get('accept-encoding'))
+    dataset = excel_data_db.current
+    query = normalize_metrics_query(period, start_date, end_date, suppliers, accounts, markets)
+    body, encoding = await run_in_threadpool(render_facets, dataset, query, media_type, encoding)
+    return wire_response(body, media_type, encoding, dataset)
+
+@app.post("/chat", dependencies=[admit_user('chat')])
 async def chat_with_ai(chat_message: ChatMessage, current_user: User = Depends(get_current_user)):
     try:
         # Create context with data summary for Gemini
@@ -1169,7 +3417,7 @@ async def chat_with_ai(chat_message: ChatMessage, current_user: User = Depends(g
         Se for sobre previsões, use os dados históricos para estimar.
         """
 
-        response = model.generate_content(context)
+        response = get_model().generate_content(context)
         return {"response": response.text}
 
     except Exception as e:
@@ -1181,6 +3429,8 @@ async def debug_databases(current_user: User = Depends(get_current_user)):
     if current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Not enough permissions")
 
+    dataset = excel_data_db.current
+
     return {
         "users": {
             "count": len(users_db.users),
@@ -1191,12 +3441,13 @@ async def debug_databases(current_user: User = Depends(get_current_user)):
             "names": list(files_db.files.keys())
         },
         "excel_data": {
-            "fato_orcamento": len(excel_data_db.fato_orcamento),
-            "fato_realizado": len(excel_data_db.fato_realizado),
-            "d_calendario": len(excel_data_db.d_calendario),
-            "d_estrutura": len(excel_data_db.d_estrutura),
-            "d_conta": len(excel_data_db.d_conta),
-            "d_fornecedor": len(excel_data_db.d_fornecedor)
+            "fato_orcamento": len(dataset.fato_orcamento),
+            "fato_realizado": len(dataset.fato_realizado),
+            "d_calendario": len(dataset.d_calendario),
+            "d_estrutura": len(dataset.d_estrutura),
+            "d_conta": len(dataset.d_conta),
+            "d_fornecedor": len(dataset.d_fornecedor),
+            "dataset_version": dataset.id
         },
         "setores": {
             "count": len(setores_db.setores),
@@ -1212,6 +3463,49 @@ async def debug_databases(current_user: User = Depends(get_current_user)):
         }
     }
 
+_snapshot_watcher = None
+_deferred_hashing = None
+
+@app.on_event("startup")
+async def hash_deferred_passwords():
+    # FAST_STARTUP leaves the master admin hash for after startup, off the event loop
+    global _deferred_hashing
+    if users_db.pending_passwords:
+        _deferred_hashing = asyncio.create_task(password_hasher.run(users_db.hash_pending_passwords))
+
+@app.on_event("startup")
+async def load_latest_snapshot():
+    # Warm start: serve the last ingested dataset without parsing the workbook again,
+    # then follow the versions other workers publish
+    global _snapshot_watcher
+    if not snapshot_store.enabled:
+        return
+    if FAST_STARTUP:
+        # Accept requests right away; they see an empty dataset until the watcher maps the snapshot
+        _snapshot_watcher = asyncio.create_task(watch_snapshots(load_now=True))
+        return
+    try:
+        version = await run_in_threadpool(sync_latest_snapshot)
+        if version is not None:
+            print(f"Loaded dataset snapshot v{version}")
+            # Serve right away; the facts are converted and indexed in the background
+            task = asyncio.create_task(run_in_threadpool(build_derived, excel_data_db.current))
+            _activation_tasks.add(task)
+            task.add_done_callback(_activation_tasks.discard)
+    except Exception as e:
+        print(f"Error loading dataset snapshot: {str(e)}")
+    _snapshot_watcher = asyncio.create_task(watch_snapshots())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    if _snapshot_watcher is not None:
+        _snapshot_watcher.cancel()
+    # Let pending activations finish so the last upload is snapshotted before exit
+    if _activation_tasks:
+        await asyncio.gather(*_activation_tasks, return_exceptions=True)
+    if _ingest_pool is not None:
+        _ingest_pool.shutdown(wait=False, cancel_futures=True)
+
 # @app.on_event("startup")
 # async def startup_event():
 #     # Load Excel data on startup